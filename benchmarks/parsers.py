@@ -0,0 +1,112 @@
+"""Benchmarks the parsers on the fixture pages.
+
+The fixture pages are generated, not captured: they mimic the markup of the
+PubMed and PMC pages which the parsers read, with made-up articles and a
+realistic amount of unrelated markup around them. They do not follow the
+changes of the real pages, which the parsers must still be checked against.
+
+For each parser, reports the number of pages parsed per second and the memory
+allocated per page. The parsed citations are checked against the expected
+ones, stored next to the fixture pages, so that an optimization of a parser
+cannot change its output unnoticed.
+
+    python -m benchmarks.parsers --iterations 50
+"""
+
+import argparse
+import dataclasses
+import glob
+import json
+import os
+import time
+import tracemalloc
+
+from bibliographer import pmc
+from bibliographer import pubmed
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+PARSERS = {
+    'pubmed': pubmed.PubmedFetcher,
+    'pmc': pmc.PMCFetcher,
+}
+
+
+def load_fixtures(kind: str):
+    """Returns the (path, page) of the fixture pages of a parser."""
+    result = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, f'{kind}_*.html'))):
+        with open(path) as fp:
+            result.append((path, fp.read()))
+    return result
+
+
+def expected_path(path: str) -> str:
+    return os.path.splitext(path)[0] + '.json'
+
+
+def check(parser, pages, update: bool = False) -> bool:
+    """Compares the parsed citations to the expected ones."""
+    ok = True
+    for path, page in pages:
+        parsed = dataclasses.asdict(parser.parse(page))
+        if update:
+            with open(expected_path(path), 'w') as fp:
+                json.dump(parsed, fp, indent=1, sort_keys=True)
+            continue
+
+        with open(expected_path(path)) as fp:
+            expected = json.load(fp)
+        if parsed != expected:
+            print(f'{os.path.basename(path)}: parsed citation has changed.')
+            ok = False
+    return ok
+
+
+def benchmark(parser, pages, iterations: int):
+    """Returns the pages per second and the peak KiB allocated per page.
+
+    Only the allocations of Python objects are traced, not the ones made by
+    libxml2 for the page tree.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for _, page in pages:
+            parser.parse(page)
+    elapsed = time.perf_counter() - start
+
+    peaks = []
+    tracemalloc.start()
+    for _, page in pages:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        parser.parse(page)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    tracemalloc.stop()
+    return iterations * len(pages) / elapsed, sum(peaks) / len(peaks) / 1024
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--iterations', type=int, default=20,
+        help='Number of times each page is parsed.')
+    parser.add_argument(
+        '--update', action='store_true',
+        help='Overwrite the expected citations with the parsed ones.')
+    args = parser.parse_args()
+
+    ok = True
+    for kind, cls in PARSERS.items():
+        pages = load_fixtures(kind)
+        fetcher = cls()
+        ok = check(fetcher, pages, args.update) and ok
+        speed, memory = benchmark(fetcher, pages, args.iterations)
+        print(f'{kind:>8}: {speed:8.1f} pages/s, {memory:8.1f} KiB/page '
+              f'({len(pages)} pages)')
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,175 @@
+"""Measures the scraper, the store and the server on synthetic corpora.
+
+For each corpus size, reports:
+  - the throughput of the scraper crawling the corpus through a fake fetcher,
+  - the cost of writing the whole corpus to the store,
+  - the latency of CitationAggregator.most_cited on the full store,
+  - the latency of the requests to MainHandler.
+
+    python -m benchmarks.scale --sizes 10000,100000 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from tornado import httpclient
+from tornado import httpserver
+from tornado import testing
+import tornado.ioloop
+
+from benchmarks import synthetic
+from bibliographer import aggregator
+from bibliographer import scraper
+from bibliographer import store
+from bibliographer.server import app
+
+
+class SyntheticScraper(scraper.BiblioScraper):
+    """A scraper crawling a synthetic corpus, stopped after `max_pages`."""
+
+    def __init__(self, fetcher, max_pages, *args, **kwargs):
+        self.fetcher = fetcher
+        self.max_pages = max_pages
+        super().__init__(*args, **kwargs)
+
+    def make_fetchers(self):
+        return [self.fetcher]
+
+    async def process(self, depth, url, fetchers) -> bool:
+        success = await super().process(depth, url, fetchers)
+        if self.count + int(success) >= self.max_pages:
+            self.stop()
+        return success
+
+
+def bench_scraper(corpus, dirname, args) -> float:
+    """Returns the number of pages scraped per second."""
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    fetcher = synthetic.SyntheticFetcher(corpus, args.latency)
+    seed = synthetic.to_url(corpus.pmid(len(corpus) - 1))
+    scp = SyntheticScraper(
+        fetcher, args.pages, os.path.join(dirname, 'scraped.db'),
+        seeds=[seed], max_depth=100, workers=args.workers, min_delay=0,
+        parse_workers=args.parse_workers)
+    loop = tornado.ioloop.IOLoop.current()
+    start = time.perf_counter()
+    loop.add_callback(scp.scrape)
+    loop.start()
+    elapsed = time.perf_counter() - start
+    loop.close(all_fds=True)
+    return scp.count / elapsed
+
+
+def bench_store(corpus, path, batch_size: int):
+    """Returns the seconds per 1000 articles written and the db size in MB."""
+    db = store.CitationStore(path)
+    start = time.perf_counter()
+    for offset in range(0, len(corpus), batch_size):
+        end = min(offset + batch_size, len(corpus))
+        db.put_many(
+            (synthetic.to_url(corpus.pmid(i)), corpus.citation(i))
+            for i in range(offset, end))
+    elapsed = time.perf_counter() - start
+    db.close()
+    size = sum(os.path.getsize(f'{path}{ext}')
+               for ext in ('', '-wal') if os.path.exists(f'{path}{ext}'))
+    return 1000 * elapsed / len(corpus), size / 2 ** 20
+
+
+def bench_most_cited(path, repeats: int) -> float:
+    """Returns the milliseconds taken by a top 50 ranking."""
+    db = store.CitationStore(path)
+    agg = aggregator.CitationAggregator(db)
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        agg.most_cited(50)
+        durations.append(time.perf_counter() - start)
+    db.close()
+    return 1000 * statistics.median(durations)
+
+
+async def bench_handler(path, args):
+    """Returns the median and 95th percentile latencies of MainHandler, in ms."""
+    config = {'db': path, 'embed_css': True, 'refresh_every': 3600}
+    webapp = app.WebApp(config)
+    await webapp.refresh()
+    sock, port = testing.bind_unused_port()
+    server = httpserver.HTTPServer(webapp)
+    server.add_sockets([sock])
+    client = httpclient.AsyncHTTPClient(force_instance=True)
+
+    durations = []
+
+    async def query():
+        for _ in range(args.requests // args.concurrency):
+            start = time.perf_counter()
+            await client.fetch(f'http://127.0.0.1:{port}/')
+            durations.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[query() for _ in range(args.concurrency)])
+    client.close()
+    server.stop()
+    webapp.db.close()
+    durations.sort()
+    p95 = durations[int(0.95 * (len(durations) - 1))]
+    return 1000 * statistics.median(durations), 1000 * p95
+
+
+def run():
+    # The workers still fetching when the scraper is stopped log errors.
+    logging.basicConfig(level=logging.CRITICAL)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--sizes', type=str, default='10000,100000',
+        help='Comma separated numbers of articles of the corpora.')
+    parser.add_argument(
+        '--latency', type=float, default=0.05,
+        help='Seconds taken by the fake fetcher to serve a page.')
+    parser.add_argument(
+        '--pages', type=int, default=2000,
+        help='Number of pages scraped at each size.')
+    parser.add_argument(
+        '--workers', type=int, default=50, help='Number of scraper workers.')
+    parser.add_argument(
+        '--parse_workers', type=int, default=0,
+        help='Number of parsing processes of the scraper.')
+    parser.add_argument(
+        '--batch_size', type=int, default=1000,
+        help='Number of articles written per transaction.')
+    parser.add_argument(
+        '--repeats', type=int, default=20,
+        help='Number of rankings measured at each size.')
+    parser.add_argument(
+        '--requests', type=int, default=200,
+        help='Number of requests sent to the server at each size.')
+    parser.add_argument(
+        '--concurrency', type=int, default=10,
+        help='Number of concurrent requests sent to the server.')
+    args = parser.parse_args()
+
+    print(f'{"articles":>10} {"edges":>10} {"scrape p/s":>11} '
+          f'{"write s/1k":>12} {"db MB":>8} {"rank ms":>8} '
+          f'{"req p50 ms":>11} {"req p95 ms":>11}')
+    for size in [int(s) for s in args.sizes.split(',')]:
+        corpus = synthetic.SyntheticCorpus(size)
+        with tempfile.TemporaryDirectory() as dirname:
+            scrape_speed = bench_scraper(corpus, dirname, args)
+            path = os.path.join(dirname, 'corpus.db')
+            write_cost, db_size = bench_store(corpus, path, args.batch_size)
+            rank_latency = bench_most_cited(path, args.repeats)
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            p50, p95 = asyncio.get_event_loop().run_until_complete(
+                bench_handler(path, args))
+        print(f'{size:>10} {len(corpus.refs):>10} {scrape_speed:>11.1f} '
+              f'{write_cost:>12.2f} {db_size:>8.1f} {rank_latency:>8.2f} '
+              f'{p50:>11.2f} {p95:>11.2f}')
+
+
+if __name__ == '__main__':
+    run()
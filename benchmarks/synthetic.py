@@ -0,0 +1,173 @@
+"""A synthetic citation graph, and a fetcher serving it as PubMed would.
+
+The number of references of each article follows a power law, and the cited
+articles are drawn with a preferential attachment, so that a few articles
+gather most of the citations as in a real corpus. Articles only cite older
+ones. The graph is kept in flat arrays so that a million articles fit in
+memory; the text of each article is generated from its id on demand.
+"""
+
+import array
+import json
+import random
+from typing import Optional
+
+from tornado import gen
+
+from bibliographer import citation
+
+URL_PREFIX = 'https://synthetic.pubmed.test'
+WORDS = (
+    'cell tumor protein expression pathway signaling mouse model patients '
+    'clinical trial analysis gene regulation response inflammation receptor '
+    'therapy cohort risk outcome association brain neural imaging metabolism '
+    'mutation sequencing immune infection vaccine microbiome stem kinase '
+    'inhibitor dose survival cancer cardiac vascular liver kidney lung'
+).split()
+NAMES = ('Anna Marc Li Sophie Ahmed Julia Kenji Olga Pedro Claire Tomas Mei '
+         'Martin Dubois Wang Schmidt Rossi Tanaka Kowalski Silva Nguyen '
+         'Garcia Moreau Olsen').split()
+JOURNALS = [f'Journal of {w.capitalize()}' for w in WORDS]
+
+
+def to_url(pmid: str) -> str:
+    return f'{URL_PREFIX}/{pmid}/'
+
+
+class SyntheticCorpus:
+    """A random citation graph of `size` articles."""
+
+    def __init__(self,
+                 size: int,
+                 seed: int = 0,
+                 alpha: float = 2.5,
+                 min_refs: int = 12,
+                 max_refs: int = 1000,
+                 attachment: float = 0.5):
+        self.size = size
+        self.seed = seed
+        rng = random.Random(seed)
+
+        # The references of article i are refs[ref_offsets[i]:ref_offsets[i+1]].
+        self.refs = array.array('i')
+        self.ref_offsets = array.array('q', [0])
+        for i in range(size):
+            count = min(i, max_refs, int(rng.paretovariate(alpha) * min_refs))
+            chosen = set()
+            while len(chosen) < count:
+                # Citing an article already cited is likelier than a new one.
+                if self.refs and rng.random() < attachment:
+                    j = self.refs[rng.randrange(len(self.refs))]
+                else:
+                    j = rng.randrange(i)
+                chosen.add(j)
+            self.refs.extend(chosen)
+            self.ref_offsets.append(len(self.refs))
+
+        # The cited-by lists, by counting sort of the references.
+        counts = array.array('q', bytes(8 * (size + 1)))
+        for j in self.refs:
+            counts[j + 1] += 1
+        for i in range(size):
+            counts[i + 1] += counts[i]
+        self.cited_offsets = array.array('q', counts)
+        self.cited_by = array.array('i', bytes(4 * len(self.refs)))
+        for i in range(size):
+            for j in self.references(i):
+                self.cited_by[counts[j]] = i
+                counts[j] += 1
+
+    def __len__(self):
+        return self.size
+
+    def references(self, i: int):
+        return self.refs[self.ref_offsets[i]:self.ref_offsets[i + 1]]
+
+    def citations(self, i: int):
+        return self.cited_by[self.cited_offsets[i]:self.cited_offsets[i + 1]]
+
+    @staticmethod
+    def pmid(i: int) -> str:
+        return str(i + 1)
+
+    @staticmethod
+    def index(pmid: str) -> int:
+        return int(pmid) - 1
+
+    def title(self, i: int) -> str:
+        rng = random.Random(self.seed * 7919 + i)
+        return ' '.join(rng.choice(WORDS) for _ in range(10)).capitalize()
+
+    def page(self, i: int) -> dict:
+        """The content of the page of an article."""
+        rng = random.Random(self.seed * 7919 + i)
+        title = ' '.join(rng.choice(WORDS) for _ in range(10)).capitalize()
+        return {
+            'pmid': self.pmid(i),
+            'title': title,
+            'authors': [f'{rng.choice(NAMES)} {rng.choice(NAMES)}'
+                        for _ in range(rng.randint(1, 8))],
+            'year': str(1950 + i * 70 // max(self.size, 1)),
+            'journal': rng.choice(JOURNALS),
+            'volume': f'{rng.randint(1, 300)}({rng.randint(1, 12)})',
+            'abstract': ' '.join(rng.choice(WORDS) for _ in range(150)),
+            'references': [[self.pmid(j), self.title(j)]
+                           for j in self.references(i)],
+            'cited_by': [[self.pmid(j), self.title(j)]
+                         for j in self.citations(i)],
+        }
+
+    def citation(self, i: int) -> citation.Citation:
+        """The citation the scraper would store for an article."""
+        return SyntheticFetcher.to_citation(self.page(i))
+
+
+class SyntheticFetcher:
+    """Serves the pages of a synthetic corpus after some latency."""
+
+    NAME = 'synthetic'
+
+    def __init__(self,
+                 corpus: Optional[SyntheticCorpus] = None,
+                 latency: float = 0.0):
+        self.corpus = corpus
+        self.latency = latency
+
+    def stop(self):
+        pass
+
+    @staticmethod
+    def matches(url: str) -> bool:
+        return url.startswith(URL_PREFIX)
+
+    async def fetch(self, url: str) -> Optional[str]:
+        if self.latency > 0:
+            await gen.sleep(self.latency)
+        i = self.corpus.index(url.rstrip('/').split('/')[-1])
+        if not 0 <= i < len(self.corpus):
+            return None
+        return json.dumps(self.corpus.page(i))
+
+    @staticmethod
+    def to_citation(page: dict) -> citation.Citation:
+        result = citation.Citation(
+            pmid=page['pmid'],
+            pm_url=to_url(page['pmid']),
+            title=page['title'],
+            abstract=page['abstract'],
+            authors=page['authors'],
+            year=page['year'],
+            journal=page['journal'],
+            volume=page['volume'],
+            # Spares the benchmarks from calling the translation API.
+            title_fr=page['title'],
+            abstract_fr=page['abstract'])
+        for key, cites in (('references', result.references),
+                           ('cited_by', result.cited_by)):
+            for pmid, title in page[key]:
+                cites.append(citation.Citation(
+                    pmid=pmid, pm_url=to_url(pmid), title=title))
+        return result
+
+    def parse(self, page: str) -> citation.Citation:
+        return self.to_citation(json.loads(page))
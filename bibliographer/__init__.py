@@ -1,4 +1,23 @@
-from bibliographer import citation
-from bibliographer import pubmed
-from bibliographer import pmc
-from bibliographer import scraper
+"""Extracts the bibliography of articles from PubMed.
+
+The submodules are imported on first use, so that the server does not load
+Selenium and the other dependencies of the scraper.
+"""
+
+import importlib
+
+_SUBMODULES = frozenset((
+    'aggregator', 'archive', 'browser', 'citation', 'coordinator', 'eutils',
+    'export', 'frontier', 'google_api', 'graph', 'identity', 'metrics', 'pmc',
+    'pubmed', 'ratelimit', 'recrawl', 'reparse', 'retry', 'scraper', 'search',
+    'snapshot', 'store', 'writer'))
+
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | _SUBMODULES)
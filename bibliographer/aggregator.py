@@ -1,57 +1,104 @@
-import collections
-import functools
+import dataclasses
 import logging
+import time
+from typing import List, Optional, Tuple
 
+from bibliographer import citation
 from bibliographer import google_api
 
 
+@dataclasses.dataclass
+class Snapshot:
+    """The ranking of the store at a given generation."""
+    generation: int = -1
+    created: float = 0.0
+    total: int = 0
+    origin: Optional[citation.Citation] = None
+    articles: List[Tuple[citation.Citation, int]] = dataclasses.field(
+        default_factory=lambda: [])
+
+
 class CitationAggregator:
-    """Finds the articles with biggest number of citations."""
+    """Finds the articles with biggest number of citations.
 
-    def __init__(self, db):
-        self._db = db
-        self._articles = {}
-        for url, citation in db.items():
-            if citation is None or not citation.pmid:
-                continue
+    The citation counts are maintained by the store as the citations are
+    written, so that ranking does not scan the whole db. The translations are
+    not fetched while ranking, but on demand with `translate`.
+    """
 
-            if not citation.pm_url:
-                citation.pm_url = url
-            self._articles[citation.pmid] = citation
-            self._db[url] = citation
+    def __init__(self, db, translator: Optional[google_api.Translator] = None):
+        self._db = db
+        self._translator = translator or google_api.Translator()
 
     def __len__(self):
-        return len(self._articles)
-
-    def may_translate(self, citation):
-        to_fr = functools.partial(google_api.translate, target='fr')
-        has_changed = False
-        if citation.abstract and not citation.abstract_fr:
-            logging.info('Fetch translations.')
-            citation.abstract_fr = to_fr(citation.abstract)
-            has_changed = True
-        if citation.title and not citation.title_fr:
-            logging.info('Fetch translations.')
-            citation.title_fr = to_fr(citation.title)
-            has_changed = True
-
-        if has_changed:
-            logging.info(f'Saving back to shelve DB.')
-            self._articles[citation.pmid] = citation
-            self._db[citation.pm_url] = citation        
-
-    def most_cited(self, k: int = 10):
-        counts = collections.Counter()
-        for ref in self._articles.values():
-            if ref is None:
-                continue
-            pmids = [r.pmid for r in ref.references if r.pmid != '']
-            if pmids:
-                counts.update(pmids)
-        topk = counts.most_common(k)
-        result = [(self._articles[v[0]], v[1])
-                  for v in topk if v[0] in self._articles]
-        for citation, _ in result:
-            self.may_translate(citation)
+        return self._db.num_articles()
+
+    def origin(self) -> Optional[citation.Citation]:
+        """The seed article, if there is a single one."""
+        origins = self._db.at_depth(1, limit=2, edges=False)
+        return origins[0] if len(origins) == 1 else None
+
+    def translate(self, citations: List[citation.Citation]):
+        """Fetches the missing french translations, in batches."""
+        todo = [(cite, field) for cite in citations
+                for field in ('title', 'abstract')
+                if getattr(cite, field) and not getattr(cite, f'{field}_fr')]
+        if not todo:
+            return
+
+        logging.info(f'Fetch {len(todo)} translations.')
+        texts = [getattr(cite, field) for cite, field in todo]
+        translations = self._translator.translate_many(texts, target='fr')
+        # The texts which could not be translated are left for a later try,
+        # without a write which would outdate the cached pages.
+        fields = {}
+        for (cite, field), text in zip(todo, translations):
+            if text:
+                setattr(cite, f'{field}_fr', text)
+                fields.setdefault(cite.pmid, {})[f'{field}_fr'] = text
+        if not fields:
+            logging.warning('No text could be translated.')
+            return
+
+        logging.info('Saving back to DB.')
+        for pmid, values in fields.items():
+            self._db.update_pmid(pmid, **values)
+        self._db.sync()
+
+    def most_cited(self, k: int = 10, depth: Optional[int] = None,
+                   offset: int = 0):
+        result = []
+        # The ranking shows neither the references nor the cited-by entries.
+        for url, cite, count in self._db.most_cited(
+                k, depth, edges=False, offset=offset):
+            if not cite.pm_url:
+                cite.pm_url = url
+            result.append((cite, count))
+        return result
+
+    def ranked(self, scores: List[Tuple[int, float]]
+               ) -> List[Tuple[citation.Citation, int, float]]:
+        """The citations, counts and scores of some (id, score) articles."""
+        scores = dict(scores)
+        result = []
+        for article_id, url, cite, count in self._db.ranked(list(scores)):
+            if not cite.pm_url:
+                cite.pm_url = url
+            result.append((cite, count, scores[article_id]))
         return result
-        
\ No newline at end of file
+
+    def search(self, query: str, k: int = 10, offset: int = 0,
+               cited_weight: float = 0.0, depth: Optional[int] = None
+               ) -> List[Tuple[citation.Citation, int, float]]:
+        """The articles best matching a full-text query."""
+        return self.ranked(
+            self._db.search.search(query, k, offset, cited_weight, depth))
+
+    def snapshot(self, k: int = 50) -> Snapshot:
+        """Precomputes what the server shows."""
+        generation = self._db.generation
+        return Snapshot(generation=generation,
+                        created=time.time(),
+                        total=len(self),
+                        origin=self.origin(),
+                        articles=self.most_cited(k))
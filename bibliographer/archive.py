@@ -0,0 +1,74 @@
+"""An archive of the raw pages fetched by the scraper.
+
+The pages are compressed and stored once under the hash of their content. An
+index maps each url to its latest page and to the kind of fetcher that got
+it, so that the pages can be parsed again later without fetching them.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Iterator, Tuple
+import zlib
+
+
+class PageArchive:
+    """A content-addressed archive of compressed pages, in a directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, 'index.db'))
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'url TEXT PRIMARY KEY, digest TEXT NOT NULL, kind TEXT NOT NULL, '
+            'fetched REAL NOT NULL)')
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    @staticmethod
+    def path(root: str, digest: str) -> str:
+        return os.path.join(root, digest[:2], digest[2:])
+
+    def put(self, url: str, kind: str, page: str) -> str:
+        """Archives the page fetched at url, returns its digest."""
+        data = page.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(self.root, digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.tmp'
+            with open(tmp, 'wb') as fp:
+                fp.write(zlib.compress(data))
+            os.replace(tmp, path)
+
+        self._conn.execute(
+            'INSERT OR REPLACE INTO pages (url, digest, kind, fetched) '
+            'VALUES (?, ?, ?, ?)', (url, digest, kind, time.time()))
+        return digest
+
+    @classmethod
+    def read(cls, root: str, digest: str) -> str:
+        """Reads a page back. A classmethod, to be used by other processes."""
+        with open(cls.path(root, digest), 'rb') as fp:
+            return zlib.decompress(fp.read()).decode('utf-8')
+
+    def get(self, url: str) -> str:
+        row = self._conn.execute(
+            'SELECT digest FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            raise KeyError(url)
+        return self.read(self.root, row[0])
+
+    def pages(self) -> Iterator[Tuple[str, str, str]]:
+        """The (url, digest, kind) of all the archived pages."""
+        yield from self._conn.execute('SELECT url, digest, kind FROM pages')
+
+    def sync(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
@@ -0,0 +1,169 @@
+"""The Chrome sessions of the Selenium fetchers.
+
+A session is started with the options of a crawl rather than the defaults:
+headless, without loading the images, fonts and style sheets, and returning
+from a page load once the DOM is ready. It is recycled after a number of
+pages or once the browser uses too much memory, since Chrome keeps growing
+over a long crawl.
+"""
+
+import dataclasses
+import logging
+import os
+from typing import Optional, Tuple
+
+import selenium.common.exceptions
+from selenium import webdriver
+from selenium.webdriver.support.wait import WebDriverWait
+
+from bibliographer import metrics
+
+RECYCLES = metrics.counter(
+    'bibliographer_browser_recycles', 'Browser sessions restarted, by reason.',
+    ['reason'])
+
+# The resources a page is parsed without.
+BLOCKED_URLS = (
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.ico', '*.webp',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.css', '*.mp4', '*.webm',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+)
+
+
+@dataclasses.dataclass
+class BrowserOptions:
+    """How the fetchers drive Chrome.
+
+    The waits for a page to be ready time out after `timeout` seconds. A
+    session is restarted after `max_pages` pages, or when the resident memory
+    of the browser and its children goes above `max_rss_mb`, if positive.
+    """
+
+    headless: bool = True
+    block_resources: bool = True
+    blocked_urls: Tuple[str, ...] = BLOCKED_URLS
+    eager: bool = True
+    timeout: float = 5.0
+    poll_every: float = 0.1
+    max_pages: int = 200
+    max_rss_mb: float = 1500.0
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """The resident memory of a process and its descendants, from /proc."""
+    if not os.path.isdir('/proc'):
+        return None
+
+    children, rss = {}, {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as fp:
+                # The name, in parentheses, may contain spaces.
+                fields = fp.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21])
+
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    total, stack = 0, [pid]
+    while stack:
+        curr = stack.pop()
+        total += rss.get(curr, 0) * page_size
+        stack.extend(children.get(curr, []))
+    return total / 2 ** 20
+
+
+class BrowserSession:
+    """A Chrome session, started on the first page and recycled as needed."""
+
+    def __init__(self, options: Optional[BrowserOptions] = None):
+        self.options = options or BrowserOptions()
+        self._driver = None
+        self.pages = 0
+
+    @property
+    def driver(self) -> webdriver.Chrome:
+        if self._driver is None:
+            self._driver = self.start()
+            self.pages = 0
+        return self._driver
+
+    def start(self) -> webdriver.Chrome:
+        options = webdriver.ChromeOptions()
+        if self.options.headless:
+            options.add_argument('--headless=new')
+            options.add_argument('--disable-gpu')
+        if self.options.eager:
+            options.page_load_strategy = 'eager'
+        options.add_argument('--disable-extensions')
+        if self.options.block_resources:
+            options.add_argument('--blink-settings=imagesEnabled=false')
+        driver = webdriver.Chrome(options=options)
+        driver.set_page_load_timeout(6 * self.options.timeout)
+        if self.options.block_resources:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd(
+                'Network.setBlockedURLs',
+                {'urls': list(self.options.blocked_urls)})
+        return driver
+
+    def rss_mb(self) -> Optional[float]:
+        """The memory of the browser, None if unknown or not started."""
+        if self._driver is None:
+            return None
+        process = getattr(self._driver.service, 'process', None)
+        return None if process is None else rss_mb(process.pid)
+
+    def recycle_reason(self) -> Optional[str]:
+        if self._driver is None:
+            return None
+        if self.options.max_pages and self.pages >= self.options.max_pages:
+            return 'pages'
+        # Reading the memory scans /proc, so it is only done once in a while.
+        if self.options.max_rss_mb > 0 and self.pages % 10 == 0:
+            rss = self.rss_mb()
+            if rss is not None and rss > self.options.max_rss_mb:
+                return 'memory'
+        return None
+
+    def get(self, url: str):
+        """Loads a page, in a new session if the current one is worn out."""
+        reason = self.recycle_reason()
+        if reason is not None:
+            logging.info(f'Recycling the browser after {self.pages} pages '
+                         f'({reason}).')
+            RECYCLES.labels(reason).inc()
+            self.stop()
+        try:
+            self.driver.get(url)
+        except selenium.common.exceptions.TimeoutException:
+            raise
+        except selenium.common.exceptions.WebDriverException:
+            # The session may have crashed: the next page gets a new one.
+            RECYCLES.labels('error').inc()
+            self.stop()
+            raise
+        self.pages += 1
+
+    def wait(self, condition):
+        """Waits for a condition on the page, up to the timeout."""
+        return WebDriverWait(
+            self.driver, self.options.timeout,
+            poll_frequency=self.options.poll_every).until(condition)
+
+    @property
+    def page_source(self) -> str:
+        return self.driver.page_source
+
+    def stop(self):
+        if self._driver is None:
+            return
+        try:
+            self._driver.quit()
+        except selenium.common.exceptions.WebDriverException as e:
+            logging.error(f'Could not stop the browser: {e}')
+        finally:
+            self._driver = None
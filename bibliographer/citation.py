@@ -1,10 +1,10 @@
 """Defines a citation object."""
 
-from typing import List
 import dataclasses
+from typing import List
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Citation:
     """A Citation is a bibliography entry."""
     pmid: str = ""
@@ -22,4 +22,21 @@ class Citation:
     references: List['Citation'] = dataclasses.field(default_factory= lambda: [])
     cited_by: List['Citation'] = dataclasses.field(default_factory= lambda: [])
     title_fr: str = ""
-    abstract_fr: str = ""
\ No newline at end of file
+    abstract_fr: str = ""
+
+    def __getstate__(self):
+        return {f.name: getattr(self, f.name) for f in dataclasses.fields(self)}
+
+    def __setstate__(self, state):
+        # The citations pickled before the slots carry their __dict__, maybe
+        # without the fields added since.
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+        for f in dataclasses.fields(self):
+            if f.name in state:
+                value = state[f.name]
+            elif f.default_factory is not dataclasses.MISSING:
+                value = f.default_factory()
+            else:
+                value = f.default
+            setattr(self, f.name, value)
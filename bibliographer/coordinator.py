@@ -0,0 +1,361 @@
+"""Crawls shared by several scrapers, on one or several machines.
+
+The urls to scrape are kept in a shared work queue rather than in the memory
+of a single scraper. Each scraper claims a few urls at a time, under a lease
+which it renews with heartbeats while it works on them. It then reports them
+as done, along with the urls they link to, once their citations have been
+committed to the store. The leases of a scraper which stops responding
+expire, and their urls are claimed again by the others.
+
+The default queue is a table in a SQLite file, which suits the scrapers of a
+machine, or of several ones sharing a file system with working locks. Other
+backends implement the WorkQueue interface.
+"""
+
+import concurrent.futures
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import tornado.gen
+import tornado.ioloop
+
+from bibliographer import identity
+from bibliographer import metrics
+from bibliographer import scraper
+from bibliographer import store
+from bibliographer import writer
+
+CLAIMED = metrics.counter(
+    'bibliographer_work_claimed', 'Urls claimed from the shared queue.')
+RECLAIMED = metrics.counter(
+    'bibliographer_work_reclaimed', 'Expired leases taken back to the queue.')
+
+# The states of a url in the queue.
+PENDING = 0
+LEASED = 1
+DONE = 2
+FAILED = 3
+STATES = {PENDING: 'pending', LEASED: 'leased', DONE: 'done', FAILED: 'failed'}
+
+
+def default_worker_id() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class WorkQueue:
+    """The interface of a work queue shared by several scrapers.
+
+    The urls come out by increasing depth, then by decreasing number of
+    known inbound references, their score. A url is queued only once: a
+    url which is done is never claimed again.
+    """
+
+    def put(self, entries: Dict[str, Tuple[int, int]]):
+        """Queues the urls, by url (depth, score) to add to the known ones."""
+        raise NotImplementedError()
+
+    def claim(self, worker: str, n: int, lease: float
+              ) -> List[Tuple[str, int, int]]:
+        """Leases up to n (url, depth, score) to a worker, for lease seconds.
+
+        The expired leases are taken back first.
+        """
+        raise NotImplementedError()
+
+    def heartbeat(self, worker: str, lease: float) -> int:
+        """Extends the leases of a worker, returns how many it holds."""
+        raise NotImplementedError()
+
+    def report(self, worker: str, entries: Dict[str, Tuple[int, int]],
+               done: List[str]):
+        """Queues the urls found by a worker and marks its urls as done."""
+        raise NotImplementedError()
+
+    def release(self, worker: str) -> int:
+        """Gives the urls leased by a worker back to the queue."""
+        raise NotImplementedError()
+
+    def counts(self) -> Dict[str, int]:
+        """The number of urls in each state."""
+        raise NotImplementedError()
+
+    def finished(self) -> bool:
+        """Whether no url is left pending or leased."""
+        counts = self.counts()
+        return not counts['pending'] and not counts['leased']
+
+    def close(self):
+        pass
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work (
+    url TEXT PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    state INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    claims INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS work_next ON work(state, depth, score DESC);
+CREATE INDEX IF NOT EXISTS work_worker ON work(worker) WHERE worker IS NOT NULL;
+"""
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """A work queue in a SQLite table, by default in the citation store.
+
+    The leases use the wall clock, which must be in sync between machines.
+    A url whose lease expired `max_claims` times, for instance because it
+    crashes the scrapers, is not claimed anymore.
+    """
+
+    def __init__(self, filename: str, max_claims: int = 3):
+        self.filename = filename
+        self.max_claims = max_claims
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            filename, timeout=30, isolation_level=None,
+            check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM work').fetchone()[0]
+
+    def _put(self, entries: Dict[str, Tuple[int, int]]):
+        self._conn.executemany(
+            'INSERT INTO work (url, depth, score) VALUES (?, ?, ?) '
+            'ON CONFLICT (url) DO UPDATE SET '
+            '  depth = MIN(depth, excluded.depth), '
+            '  score = score + excluded.score '
+            f'WHERE state = {PENDING}',
+            [(url, depth, score) for url, (depth, score) in entries.items()])
+
+    def put(self, entries: Dict[str, Tuple[int, int]]):
+        with self._lock, self._transaction():
+            self._put(entries)
+
+    def claim(self, worker: str, n: int, lease: float
+              ) -> List[Tuple[str, int, int]]:
+        now = time.time()
+        with self._lock, self._transaction():
+            reclaimed = self._conn.execute(
+                f'UPDATE work SET worker = NULL, lease_until = NULL, '
+                f'  state = CASE WHEN claims >= ? THEN {FAILED} '
+                f'          ELSE {PENDING} END '
+                f'WHERE state = {LEASED} AND lease_until < ?',
+                (self.max_claims, now)).rowcount
+            rows = self._conn.execute(
+                f'SELECT url, depth, score FROM work WHERE state = {PENDING} '
+                'ORDER BY depth, score DESC LIMIT ?', (n,)).fetchall()
+            self._conn.executemany(
+                f'UPDATE work SET state = {LEASED}, worker = ?, '
+                '  lease_until = ?, claims = claims + 1 WHERE url = ?',
+                [(worker, now + lease, url) for url, _, _ in rows])
+        if reclaimed:
+            logging.warning(f'Took back {reclaimed} expired leases.')
+            RECLAIMED.inc(reclaimed)
+        CLAIMED.inc(len(rows))
+        return rows
+
+    def heartbeat(self, worker: str, lease: float) -> int:
+        with self._lock, self._transaction():
+            return self._conn.execute(
+                f'UPDATE work SET lease_until = ? '
+                f'WHERE worker = ? AND state = {LEASED}',
+                (time.time() + lease, worker)).rowcount
+
+    def report(self, worker: str, entries: Dict[str, Tuple[int, int]],
+               done: List[str]):
+        # The found urls are queued before their source is done, so that the
+        # queue never looks finished in between.
+        with self._lock, self._transaction():
+            self._put(entries)
+            self._conn.executemany(
+                f'UPDATE work SET state = {DONE}, worker = NULL, '
+                '  lease_until = NULL WHERE url = ?',
+                [(url,) for url in done])
+
+    def release(self, worker: str) -> int:
+        with self._lock, self._transaction():
+            return self._conn.execute(
+                f'UPDATE work SET state = {PENDING}, worker = NULL, '
+                '  lease_until = NULL, claims = claims - 1 '
+                f'WHERE worker = ? AND state = {LEASED}', (worker,)).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = dict(self._conn.execute(
+                'SELECT state, COUNT(*) FROM work GROUP BY state'))
+        return {name: rows.get(state, 0) for state, name in STATES.items()}
+
+    def _transaction(self):
+        return Transaction(self._conn)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Transaction:
+    """Holds the write lock of a SQLite database, from the first statement."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def __enter__(self):
+        self._conn.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc, tb):
+        self._conn.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+
+
+class LeaseWriter(writer.StoreWriter):
+    """A store writer which reports the progress of a worker to the queue.
+
+    The scraper checkpoints its frontier to its writer: the urls it finds are
+    queued, and the urls it is done with are reported as done, once their
+    citations are committed. Meanwhile, the leases of the worker are renewed
+    every third of their duration.
+    """
+
+    def __init__(self,
+                 db: store.CitationStore,
+                 queue: WorkQueue,
+                 worker: str,
+                 lease: float,
+                 flush_every: float = 1.0):
+        super().__init__(db, flush_every)
+        self.queue = queue
+        self.worker = worker
+        self.lease = lease
+        self._next_heartbeat = time.monotonic() + lease / 3
+
+    def frontier_put(self, url: str, depth: int, score: int):
+        # Each sighting of a url adds to its score in the queue.
+        with self._lock:
+            entry = self._frontier.get(url, (depth, 0))
+            if entry is not None:
+                self._frontier[url] = (min(entry[0], depth), entry[1] + score)
+
+    def write(self, db: store.CitationStore, citations: dict, depths: dict,
+              frontier: dict, fetched_at: Optional[dict] = None,
+              frontier_depth: Optional[int] = None):
+        super().write(db, citations, depths, {}, fetched_at)
+        if frontier:
+            self.queue.report(
+                self.worker,
+                {url: entry for url, entry in frontier.items() if entry},
+                [url for url, entry in frontier.items() if entry is None])
+
+    def flush(self, db: store.CitationStore):
+        super().flush(db)
+        if time.monotonic() < self._next_heartbeat:
+            return
+        try:
+            self.queue.heartbeat(self.worker, self.lease)
+            self._next_heartbeat = time.monotonic() + self.lease / 3
+        except Exception as e:
+            logging.error(f'Cannot renew the leases of {self.worker}: {e}')
+
+
+class CoordinatedScraper(scraper.BiblioScraper):
+    """A scraper taking its urls from a work queue shared with others.
+
+    It keeps up to `prefetch` claimed urls ahead of its workers, leased for
+    `lease` seconds. It stops once no url is left pending or leased in the
+    queue, and gives the urls it still holds back to the queue when stopped.
+    The other arguments are the ones of BiblioScraper.
+    """
+
+    def __init__(self,
+                 filename: str,
+                 queue: Optional[WorkQueue] = None,
+                 worker_id: Optional[str] = None,
+                 lease: float = 300.0,
+                 prefetch: Optional[int] = None,
+                 poll_every: float = 1.0,
+                 **kwargs):
+        self.work_queue = queue or SQLiteWorkQueue(filename)
+        self.worker_id = worker_id or default_worker_id()
+        self.lease = lease
+        self.poll_every = poll_every
+        # Claims and polls never wait behind the fetches.
+        self._queue_executor = concurrent.futures.ThreadPoolExecutor(1)
+        super().__init__(filename, **kwargs)
+        self.prefetch = prefetch or 2 * len(self.fetchers)
+        logging.info(f'Worker {self.worker_id} joining a queue of '
+                     f'{self.work_queue.counts()}')
+
+    def make_writer(self, flush_every: float) -> writer.StoreWriter:
+        return LeaseWriter(
+            self.store, self.work_queue, self.worker_id, self.lease,
+            flush_every)
+
+    def add_to_queue(self, depth: int, url: str):
+        """Queues a url in the shared queue, which skips the known ones."""
+        url = identity.canonical_url(url)
+        if url:
+            self.db.frontier_put(url, depth, 1)
+
+    def initialize_queue(self):
+        """Queues the seeds, or the links of the store in a new queue."""
+        if self.seeds:
+            for seed in self.seeds:
+                self.add_to_queue(0, seed)
+            return
+
+        if len(self.work_queue):
+            return
+        for cite in self.store.values():
+            self.count += 1
+            if cite is not None:
+                self.add_citation_to_queue(cite)
+        logging.info(f'Queued the links of {self.count} stored citations.')
+
+    async def wait_done(self):
+        """Claims urls for the workers until the shared queue is finished."""
+        loop = tornado.ioloop.IOLoop.current()
+        while not self._stop_request:
+            wanted = self.prefetch - self.queue.qsize()
+            claimed = []
+            if wanted > 0:
+                claimed = await loop.run_in_executor(
+                    self._queue_executor, self.work_queue.claim,
+                    self.worker_id, wanted, self.lease)
+                for url, depth, score in claimed:
+                    self.queue.restore(url, depth, score)
+            if claimed or self.queue.qsize():
+                await tornado.gen.sleep(0.1)
+                continue
+            if not self.db.idle():
+                # The urls found here may not be queued yet.
+                self.db.sync()
+                await tornado.gen.sleep(self.poll_every)
+                continue
+
+            # A url is leased until its links are queued.
+            finished = await loop.run_in_executor(
+                self._queue_executor, self.work_queue.finished)
+            if finished:
+                break
+            await tornado.gen.sleep(self.poll_every)
+
+    def stop(self, *args):
+        if self._stop_request:
+            return
+        super().stop(*args)
+        released = self.work_queue.release(self.worker_id)
+        if released:
+            logging.info(f'Gave {released} urls back to the queue.')
+        logging.info(f'Left a queue of {self.work_queue.counts()}')
+        self.work_queue.close()
+        self._queue_executor.shutdown(wait=False)
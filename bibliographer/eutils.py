@@ -0,0 +1,238 @@
+"""A browser-free fetcher for PubMed based on the NCBI E-utilities.
+
+Instead of rendering the PubMed pages in a browser, the article metadata is
+retrieved with efetch and the references and cited-by links with elink, over
+plain async HTTP. Both APIs accept many ids per request, so the concurrent
+calls to `fetch` are gathered into batches.
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional
+import urllib.parse
+
+import lxml
+import lxml.etree
+from tornado import concurrent
+from tornado import gen
+from tornado import httpclient
+import tornado.ioloop
+
+from bibliographer import citation
+from bibliographer import pubmed
+from bibliographer import ratelimit
+
+EUTILS_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils'
+PMC_URL_PREFIX = 'www.ncbi.nlm.nih.gov/pmc/articles'
+
+
+def to_pmc_url(pmcid: str):
+    return f'https://{PMC_URL_PREFIX}/{pmcid}/'
+
+
+class EutilsFetcher:
+    """Fetches PubMed records as XML and parses them into Citations.
+
+    `fetch` returns one XML record per article, made of its PubmedArticle
+    element followed by the ids of its references and of the articles citing
+    it. The calls made within `max_wait` seconds of each other are sent as a
+    single batch of at most `batch_size` articles, so the fetcher is meant to
+    be shared by all the workers of a scraper.
+    """
+
+    NAME = 'eutils'
+
+    def __init__(self,
+                 base_url: str = EUTILS_URL,
+                 batch_size: int = 200,
+                 max_wait: float = 0.5,
+                 api_key: Optional[str] = None,
+                 timeout: float = 60.0):
+        self.base_url = base_url.rstrip('/')
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.api_key = api_key or os.environ.get('NCBI_API_KEY')
+        # NCBI allows 3 requests per second, 10 with an API key.
+        self._limiter = ratelimit.HostRateLimiter(
+            0.1 if self.api_key else 0.34)
+        self._client = None
+        self._pending = {}
+        self._timeout_handle = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpclient.AsyncHTTPClient(force_instance=True)
+        return self._client
+
+    def stop(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    @staticmethod
+    def matches(url: str) -> bool:
+        return 'pubmed.ncbi.nlm.nih.gov' in url or PMC_URL_PREFIX in url
+
+    async def request(self, tool: str, params: dict) -> bytes:
+        """Posts a query to one of the E-utilities and returns the XML."""
+        params = dict(params, retmode='xml')
+        if self.api_key:
+            params['api_key'] = self.api_key
+        await self._limiter.wait(self.base_url)
+        resp = await self.client.fetch(
+            f'{self.base_url}/{tool}.fcgi',
+            method='POST',
+            body=urllib.parse.urlencode(params, doseq=True),
+            request_timeout=self.timeout)
+        return resp.body
+
+    async def to_pmid(self, url: str) -> Optional[str]:
+        """Finds the PMID of a PubMed or PMC url."""
+        if 'pubmed.ncbi.nlm.nih.gov' in url:
+            return url.rstrip('/').split('/')[-1]
+
+        pmcid = url.rstrip('/').split('/')[-1]
+        body = await self.request('elink', {
+            'dbfrom': 'pmc', 'db': 'pubmed', 'linkname': 'pmc_pubmed',
+            'id': pmcid.upper().lstrip('PMC')})
+        ids = lxml.etree.fromstring(body).xpath('//LinkSetDb/Link/Id/text()')
+        return ids[0] if ids else None
+
+    async def fetch(self, url: str) -> Optional[str]:
+        """Returns the XML record of the article, or None if not found."""
+        logging.info(f'Fetching: {url}')
+        pmid = await self.to_pmid(url)
+        if not pmid:
+            return None
+
+        future = self._pending.get(pmid)
+        if future is None:
+            future = concurrent.Future()
+            self._pending[pmid] = future
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+            elif self._timeout_handle is None:
+                self._timeout_handle = tornado.ioloop.IOLoop.current().call_later(
+                    self.max_wait, self.flush)
+        return await future
+
+    def flush(self):
+        """Sends the pending requests as one batch."""
+        loop = tornado.ioloop.IOLoop.current()
+        if self._timeout_handle is not None:
+            loop.remove_timeout(self._timeout_handle)
+            self._timeout_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            loop.spawn_callback(self.fetch_batch, batch)
+
+    async def fetch_batch(self, batch: Dict[str, concurrent.Future]):
+        try:
+            records = await self.fetch_records(list(batch))
+        except Exception as e:
+            logging.error(f'Could not fetch a batch of {len(batch)}: {e}')
+            for future in batch.values():
+                future.set_exception(e)
+            return
+
+        for pmid, future in batch.items():
+            future.set_result(records.get(pmid))
+
+    async def fetch_records(self, pmids: List[str]) -> Dict[str, str]:
+        """Fetches the XML records of a batch of PMIDs."""
+        logging.info(f'Fetching a batch of {len(pmids)} articles.')
+        articles, refs, cited_by = await gen.multi([
+            self.request('efetch', {'db': 'pubmed', 'id': ','.join(pmids)}),
+            self.request('elink', {
+                'dbfrom': 'pubmed', 'db': 'pubmed', 'id': pmids,
+                'linkname': 'pubmed_pubmed_refs'}),
+            self.request('elink', {
+                'dbfrom': 'pubmed', 'db': 'pubmed', 'id': pmids,
+                'linkname': 'pubmed_pubmed_citedin'}),
+        ])
+        links = {'References': self.parse_links(refs),
+                 'CitedBy': self.parse_links(cited_by)}
+
+        result = {}
+        for article in lxml.etree.fromstring(articles).iterfind('PubmedArticle'):
+            pmid = article.findtext('MedlineCitation/PMID')
+            record = lxml.etree.Element('EutilsRecord')
+            record.append(article)
+            for tag, ids in links.items():
+                elem = lxml.etree.SubElement(record, tag)
+                for link in ids.get(pmid, []):
+                    lxml.etree.SubElement(elem, 'Id').text = link
+            result[pmid] = lxml.etree.tostring(record, encoding='unicode')
+        return result
+
+    @staticmethod
+    def parse_links(body: bytes) -> Dict[str, List[str]]:
+        """Maps each PMID of an elink answer to its linked PMIDs."""
+        result = {}
+        for linkset in lxml.etree.fromstring(body).iterfind('LinkSet'):
+            pmid = linkset.findtext('IdList/Id')
+            result[pmid] = linkset.xpath('LinkSetDb/Link/Id/text()')
+        return result
+
+    def parse(self, xml: str) -> citation.Citation:
+        """Parses an XML record into a Citation entry."""
+        record = lxml.etree.fromstring(xml)
+        article = record.find('PubmedArticle')
+        medline = article.find('MedlineCitation')
+        infos = medline.find('Article')
+
+        result = citation.Citation()
+        result.pmid = medline.findtext('PMID')
+        result.pm_url = pubmed.to_url(result.pmid)
+        result.title = ''.join(infos.find('ArticleTitle').itertext()).strip()
+        result.abstract = ' '.join(
+            ''.join(elem.itertext()).strip()
+            for elem in infos.iterfind('Abstract/AbstractText'))
+
+        result.authors = []
+        result.affiliations = []
+        for author in infos.iterfind('AuthorList/Author'):
+            name = ' '.join(author.findtext(tag, '')
+                            for tag in ('ForeName', 'LastName')).strip()
+            result.authors.append(name or author.findtext('CollectiveName', ''))
+            result.affiliations.extend(
+                author.xpath('AffiliationInfo/Affiliation/text()'))
+
+        journal = infos.find('Journal')
+        result.journal = journal.findtext('Title', '')
+        result.volume = journal.findtext('JournalIssue/Volume', '')
+        issue = journal.findtext('JournalIssue/Issue')
+        if issue:
+            result.volume = f'{result.volume}({issue})'
+        result.year = (journal.findtext('JournalIssue/PubDate/Year') or
+                       journal.findtext('JournalIssue/PubDate/MedlineDate', ''))
+
+        pmcid = article.findtext('PubmedData/ArticleIdList/ArticleId[@IdType="pmc"]')
+        if pmcid:
+            result.pmcid = pmcid
+            result.pmc_url = to_pmc_url(pmcid)
+
+        # The reference list has the titles, elink has the complete list.
+        refs = {}
+        for ref in article.iterfind('PubmedData/ReferenceList/Reference'):
+            curr = citation.Citation()
+            curr.title = ref.findtext('Citation', '').strip()
+            curr.pmid = ref.findtext('ArticleIdList/ArticleId[@IdType="pubmed"]', '')
+            curr.pmcid = ref.findtext('ArticleIdList/ArticleId[@IdType="pmc"]', '')
+            if curr.pmid:
+                curr.pm_url = pubmed.to_url(curr.pmid)
+                refs[curr.pmid] = curr
+            if curr.pmcid:
+                curr.pmc_url = to_pmc_url(curr.pmcid)
+            result.references.append(curr)
+        for pmid in record.xpath('References/Id/text()'):
+            if pmid not in refs:
+                result.references.append(
+                    citation.Citation(pmid=pmid, pm_url=pubmed.to_url(pmid)))
+
+        for pmid in record.xpath('CitedBy/Id/text()'):
+            result.cited_by.append(
+                citation.Citation(pmid=pmid, pm_url=pubmed.to_url(pmid)))
+        return result
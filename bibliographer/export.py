@@ -0,0 +1,114 @@
+"""Exports the stored citations as JSONL, CSV, BibTeX or RIS.
+
+The citations are streamed from the store: `export` yields the formatted
+text in chunks of `batch_size` articles, so that the memory used does not
+depend on the number of exported articles.
+"""
+
+import csv
+import io
+import json
+import re
+from typing import Iterator, Optional
+
+from bibliographer import citation
+from bibliographer import store
+
+# The exported fields, in the order of the CSV columns.
+FIELDS = ('url', 'cited', 'pmid', 'pmcid', 'pm_url', 'pmc_url', 'title',
+          'authors', 'year', 'journal', 'volume', 'depth', 'abstract',
+          'affiliations', 'title_fr', 'abstract_fr')
+# The content type and the file extension of each format.
+FORMATS = {
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'csv': ('text/csv', 'csv'),
+    'bibtex': ('application/x-bibtex', 'bib'),
+    'ris': ('application/x-research-info-systems', 'ris'),
+}
+
+
+def to_dict(url: str, cite: citation.Citation, cited: int) -> dict:
+    result = {'url': url, 'cited': cited}
+    result.update({f: getattr(cite, f) for f in FIELDS[2:]})
+    return result
+
+
+def to_jsonl(url: str, cite: citation.Citation, cited: int) -> str:
+    return json.dumps(to_dict(url, cite, cited), ensure_ascii=False) + '\n'
+
+
+def to_csv(url: str, cite: citation.Citation, cited: int) -> str:
+    row = to_dict(url, cite, cited)
+    for field in ('authors', 'affiliations'):
+        row[field] = '; '.join(row[field] or [])
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([row[f] for f in FIELDS])
+    return buffer.getvalue()
+
+
+def bibtex_escape(text) -> str:
+    return re.sub(r'([{}\\])', r'\\\1', str(text or ''))
+
+
+def to_bibtex(url: str, cite: citation.Citation, cited: int) -> str:
+    key = f'pmid{cite.pmid}' if cite.pmid else re.sub(r'\W', '', url)
+    fields = [('title', cite.title),
+              ('author', ' and '.join(cite.authors or [])),
+              ('journal', cite.journal),
+              ('year', cite.year),
+              ('volume', cite.volume),
+              ('abstract', cite.abstract),
+              ('pmid', cite.pmid),
+              ('pmcid', cite.pmcid),
+              ('url', url)]
+    lines = [f'  {name} = {{{bibtex_escape(value)}}},'
+             for name, value in fields if value]
+    return '@article{' + key + ',\n' + '\n'.join(lines) + '\n}\n\n'
+
+
+def to_ris(url: str, cite: citation.Citation, cited: int) -> str:
+    lines = ['TY  - JOUR']
+    tags = [('TI', cite.title)]
+    tags.extend(('AU', author) for author in cite.authors or [])
+    tags.extend([('JO', cite.journal),
+                 ('PY', cite.year),
+                 ('VL', cite.volume),
+                 ('AB', cite.abstract),
+                 ('AN', cite.pmid),
+                 ('UR', url)])
+    lines.extend(f'{tag}  - {" ".join(str(value).split())}'
+                 for tag, value in tags if value)
+    lines.append('ER  - ')
+    return '\n'.join(lines) + '\n\n'
+
+
+WRITERS = {
+    'jsonl': to_jsonl,
+    'csv': to_csv,
+    'bibtex': to_bibtex,
+    'ris': to_ris,
+}
+
+
+def export(db: store.CitationStore,
+           fmt: str = 'jsonl',
+           depth: Optional[int] = None,
+           min_cited: int = 0,
+           batch_size: int = 1000) -> Iterator[str]:
+    """Yields the stored citations in the given format, chunk by chunk."""
+    if fmt not in WRITERS:
+        raise ValueError(f'Unknown format: {fmt}')
+
+    write = WRITERS[fmt]
+    chunk = []
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(FIELDS)
+        chunk.append(buffer.getvalue())
+    for url, cite, cited in db.stream(depth, min_cited):
+        chunk.append(write(url, cite, cited))
+        if len(chunk) >= batch_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,138 @@
+"""The crawl frontier: the urls waiting to be scraped."""
+
+import hashlib
+import heapq
+import itertools
+import math
+from typing import Optional, Tuple
+
+from tornado import queues
+
+
+class BloomFilter:
+    """A set of strings in a bounded memory, with some false positives."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.num_bits = max(8, int(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(
+            self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little')
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str):
+        for pos in self.positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self.positions(item))
+
+
+class Frontier(queues.Queue):
+    """A deduplicating priority queue of (depth, url).
+
+    A url is queued only once: putting it again while it is pending counts as
+    one more known inbound reference, and putting it after it has been taken
+    out is a no-op. The urls come out by increasing depth, then by decreasing
+    number of inbound references.
+
+    The seen urls are kept in a set, or in a Bloom filter of the given
+    capacity when `max_seen` is set, to bound the memory of deep crawls.
+
+    When given a `checkpoint`, for instance the citation store, each new or
+    updated pending url is written to it with `frontier_put`. Removing the
+    processed urls from it is left to the caller, once they are done.
+    """
+
+    def __init__(self, max_seen: Optional[int] = None, checkpoint=None):
+        self._seen = BloomFilter(max_seen) if max_seen else set()
+        self._checkpoint = checkpoint
+        super().__init__()
+
+    def _init(self):
+        self._queue = []
+        self._pending = {}
+        self._counter = itertools.count()
+
+    def qsize(self) -> int:
+        return len(self._pending)
+
+    def empty(self) -> bool:
+        # The heap may only hold outdated entries.
+        return not self._pending
+
+    def has_seen(self, url: str) -> bool:
+        return url in self._pending or url in self._seen
+
+    def mark_seen(self, url: str):
+        self._seen.add(url)
+
+    def put_nowait(self, item: Tuple[int, str]):
+        depth, url = item
+        entry = self._pending.get(url)
+        if entry is not None:
+            entry[0] = min(entry[0], depth)
+            entry[1] += 1
+            self._push(url, entry)
+            if self._checkpoint is not None:
+                self._checkpoint.frontier_put(url, *entry)
+            return
+        if url in self._seen:
+            return
+
+        self._seen.add(url)
+        super().put_nowait(item)
+        if self._checkpoint is not None:
+            self._checkpoint.frontier_put(url, depth, 1)
+
+    def restore(self, url: str, depth: int, score: float,
+                checkpoint: bool = False):
+        """Queues back a checkpointed url, or a seen url to visit again.
+
+        A url already pending keeps a single entry, with the lowest depth and
+        the highest score of the two. With `checkpoint`, the url is written
+        to the checkpoint as well.
+        """
+        entry = self._pending.get(url)
+        if entry is not None:
+            entry[0] = min(entry[0], depth)
+            entry[1] = max(entry[1], score)
+            self._push(url, entry)
+        else:
+            self._seen.add(url)
+            super().put_nowait((depth, url))
+            # Unless it went straight to a waiting consumer.
+            entry = self._pending.get(url)
+            if entry is not None:
+                entry[1] = score
+                self._push(url, entry)
+        if checkpoint and self._checkpoint is not None:
+            self._checkpoint.frontier_put(url, *(entry or (depth, score)))
+
+    def _push(self, url: str, entry: list):
+        # The outdated entries of the url stay in the heap, ignored by _get.
+        heapq.heappush(self._queue, (entry[0], -entry[1], next(self._counter), url))
+        if len(self._queue) > 4 * len(self._pending) + 1024:
+            self._queue = [(e[0], -e[1], next(self._counter), u)
+                           for u, e in self._pending.items()]
+            heapq.heapify(self._queue)
+
+    def _put(self, item: Tuple[int, str]):
+        depth, url = item
+        entry = [depth, 1]
+        self._pending[url] = entry
+        self._push(url, entry)
+
+    def _get(self) -> Tuple[int, str]:
+        while True:
+            depth, score, _, url = heapq.heappop(self._queue)
+            if self._pending.get(url) == [depth, -score]:
+                del self._pending[url]
+                return depth, url
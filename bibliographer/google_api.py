@@ -1,36 +1,163 @@
 """A wrapper around google translate API."""
 
+import hashlib
 import logging
-import requests
 import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import requests
+
+from bibliographer import metrics
 
 TRANSLATE_URL = 'https://translation.googleapis.com/language/translate/v2'
 
+REQUEST_SECONDS = metrics.histogram(
+    'bibliographer_translate_request_seconds',
+    'Time of a request to the translation API.')
+TEXTS = metrics.counter(
+    'bibliographer_translate_texts',
+    'Texts translated, from the cache or from the API.', ['source'])
 
-def translate(text: str, target: str, source: str = 'en'):
-    """Translates the source text into the target language."""
 
-    api_key = os.environ.get('GOOGLE_API_KEY')
-    if api_key is None:
-        raise ValueError('Missing GOOGLE_API_KEY environment variable.')
+class TranslationCache:
+    """A persistent cache of translations.
+
+    The translations are keyed by the hash of the source text and by the
+    source and target languages. The cache can be shared between threads.
+    """
+
+    def __init__(self, filename: str = ':memory:'):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS translations ('
+            'digest TEXT NOT NULL, source TEXT NOT NULL, target TEXT NOT NULL, '
+            'translation TEXT NOT NULL, PRIMARY KEY (digest, source, target))')
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, texts: List[str], target: str, source: str
+                 ) -> Dict[str, str]:
+        """Maps the digests of the cached texts to their translations."""
+        digests = list({self.digest(text) for text in texts})
+        result = {}
+        with self._lock:
+            # Stays below the maximum number of variables of a query.
+            for i in range(0, len(digests), 500):
+                chunk = digests[i:i + 500]
+                marks = ', '.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    'SELECT digest, translation FROM translations '
+                    f'WHERE source = ? AND target = ? AND digest IN ({marks})',
+                    [source, target] + chunk)
+                result.update(rows.fetchall())
+        return result
+
+    def put_many(self, translations: Dict[str, str], target: str, source: str):
+        """Caches the translations of some texts."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)',
+                [(self.digest(text), source, target, translation)
+                 for text, translation in translations.items()])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
 
-    data = {
-        'q': text,
-        'target': target,
-        'source': source,
-        'format': 'text',
-        'model': 'nmt',
-        'key': api_key
-    }
-    resp = requests.post(TRANSLATE_URL, data=data)
-    if not resp.ok:
-        message = resp.json()['error']['message']
-        logging.error(f'Wrong request: {message}')
-        return None
 
-    return resp.json()['data']['translations'][0]['translatedText']
+class Translator:
+    """Translates texts with a cache and batched calls to the API.
 
-    
+    Only the texts missing from the cache are sent, many of them per request,
+    through a single HTTP session.
+    """
 
+    def __init__(self,
+                 cache: Optional[TranslationCache] = None,
+                 url: str = TRANSLATE_URL,
+                 api_key: Optional[str] = None,
+                 batch_size: int = 100,
+                 max_chars: int = 25000):
+        self.cache = cache if cache is not None else TranslationCache()
+        self.url = url
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self._session = requests.Session()
 
+    def batches(self, texts: List[str]):
+        """Splits the texts into batches small enough for a single request."""
+        batch, size = [], 0
+        for text in texts:
+            if batch and (len(batch) == self.batch_size or
+                          size + len(text) > self.max_chars):
+                yield batch
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text)
+        if batch:
+            yield batch
 
+    def request(self, texts: List[str], target: str, source: str
+                ) -> Optional[List[str]]:
+        api_key = self.api_key or os.environ.get('GOOGLE_API_KEY')
+        if api_key is None:
+            raise ValueError('Missing GOOGLE_API_KEY environment variable.')
+
+        data = [('q', text) for text in texts] + [
+            ('target', target),
+            ('source', source),
+            ('format', 'text'),
+            ('model', 'nmt'),
+            ('key', api_key),
+        ]
+        with REQUEST_SECONDS.time():
+            resp = self._session.post(self.url, data=data)
+        if not resp.ok:
+            message = resp.json()['error']['message']
+            logging.error(f'Wrong request: {message}')
+            return None
+
+        return [t['translatedText'] for t in resp.json()['data']['translations']]
+
+    def translate_many(self, texts: List[str], target: str, source: str = 'en'
+                       ) -> List[Optional[str]]:
+        """Translates the texts, None for the ones that could not be."""
+        cached = self.cache.get_many(texts, target, source)
+        missing = list({text: None for text in texts
+                        if self.cache.digest(text) not in cached})
+        TEXTS.labels('cache').inc(len(texts) - len(missing))
+        TEXTS.labels('api').inc(len(missing))
+        translations = {}
+        for batch in self.batches(missing):
+            logging.info(f'Translating {len(batch)} texts.')
+            result = self.request(batch, target, source)
+            if result is not None:
+                translations.update(zip(batch, result))
+        if translations:
+            self.cache.put_many(translations, target, source)
+
+        return [cached.get(self.cache.digest(text), translations.get(text))
+                for text in texts]
+
+    def translate(self, text: str, target: str, source: str = 'en'):
+        return self.translate_many([text], target, source)[0]
+
+    def close(self):
+        self._session.close()
+
+
+_translator = None
+
+
+def translate(text: str, target: str, source: str = 'en'):
+    """Translates the source text into the target language."""
+    global _translator
+    if _translator is None:
+        _translator = Translator()
+    return _translator.translate(text, target, source)
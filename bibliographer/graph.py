@@ -0,0 +1,171 @@
+"""Rankings computed on the whole citation graph.
+
+The edges of the store are loaded into a sparse adjacency matrix A, where
+A[i, j] is 1 when the article i cites the article j, the rows and columns
+being the ids of the articles in the store. On top of the raw number of
+citations, the articles can then be ranked by:
+  - pagerank: their PageRank in the citation graph,
+  - cocitation: how often they are cited along with the seeds, A^T A s,
+  - coupling: how many references they share with the seeds, A A^T s,
+where s is the indicator of the seeds, the articles at depth 1.
+
+This module needs numpy and scipy, from the 'graph' extra.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse
+
+from bibliographer import store
+
+MODES = ('pagerank', 'cocitation', 'coupling')
+
+
+class CitationGraph:
+    """The citation graph of a store, as a sparse matrix."""
+
+    def __init__(self, citing: np.ndarray, cited: np.ndarray,
+                 ranked: np.ndarray, depth: np.ndarray):
+        n = len(ranked)
+        adjacency = scipy.sparse.csr_matrix(
+            (np.ones(len(citing), dtype=np.float64), (citing, cited)),
+            shape=(n, n))
+        # An edge may be listed both as a reference and as a cited-by entry.
+        adjacency.data[:] = 1.0
+        self.adjacency = adjacency
+        self.ranked = ranked
+        self.depth = depth
+        self._scores: Dict[str, np.ndarray] = {}
+
+    def __len__(self):
+        return self.adjacency.shape[0]
+
+    @classmethod
+    def from_store(cls, db: store.CitationStore) -> 'CitationGraph':
+        """Loads the edges and the rankable articles of a store."""
+        n = db.max_id() + 1
+        edges = np.fromiter(
+            itertools.chain.from_iterable(db.graph_edges()), dtype=np.int64)
+        edges = edges.reshape(-1, 3)
+        is_ref = edges[:, 1] == store.REFERENCE
+        citing = np.where(is_ref, edges[:, 0], edges[:, 2])
+        cited = np.where(is_ref, edges[:, 2], edges[:, 0])
+
+        ranked = np.zeros(n, dtype=bool)
+        depth = np.full(n, -1, dtype=np.int64)
+        rows = np.fromiter(
+            itertools.chain.from_iterable(db.ranked_ids()), dtype=np.int64)
+        rows = rows.reshape(-1, 2)
+        ranked[rows[:, 0]] = True
+        depth[rows[:, 0]] = rows[:, 1]
+        return cls(citing, cited, ranked, depth)
+
+    def pagerank(self, damping: float = 0.85, tol: float = 1e-10,
+                 max_iter: int = 100) -> np.ndarray:
+        """The PageRank of the articles, by power iteration."""
+        n = len(self)
+        out_degree = np.asarray(self.adjacency.sum(axis=1)).ravel()
+        dangling = out_degree == 0
+        inv_degree = np.divide(1.0, out_degree, out=np.zeros(n),
+                               where=~dangling)
+        transposed = self.adjacency.T.tocsr()
+        rank = np.full(n, 1.0 / n)
+        for _ in range(max_iter):
+            leak = rank[dangling].sum()
+            new = damping * (transposed @ (rank * inv_degree))
+            new += (damping * leak + 1.0 - damping) / n
+            if np.abs(new - rank).sum() < tol:
+                return new
+            rank = new
+        logging.warning(f'PageRank did not converge in {max_iter} iterations.')
+        return rank
+
+    def seeds(self) -> np.ndarray:
+        return (self.depth == 1).astype(np.float64)
+
+    def co_citation(self, seeds: Optional[np.ndarray] = None) -> np.ndarray:
+        """The number of times each article is cited along with the seeds."""
+        seeds = self.seeds() if seeds is None else seeds
+        return self.adjacency.T @ (self.adjacency @ seeds)
+
+    def coupling(self, seeds: Optional[np.ndarray] = None) -> np.ndarray:
+        """The number of references each article shares with the seeds."""
+        seeds = self.seeds() if seeds is None else seeds
+        return self.adjacency @ (self.adjacency.T @ seeds)
+
+    def scores(self, mode: str) -> np.ndarray:
+        """The scores of a ranking mode, computed once."""
+        if mode not in MODES:
+            raise ValueError(f'Unknown ranking mode: {mode}')
+        if mode not in self._scores:
+            start = time.perf_counter()
+            if mode == 'pagerank':
+                scores = self.pagerank()
+            elif mode == 'cocitation':
+                scores = self.co_citation()
+            else:
+                scores = self.coupling()
+            logging.info(f'Computed {mode} of {len(self)} articles in '
+                         f'{time.perf_counter() - start:.2f}s')
+            self._scores[mode] = scores
+        return self._scores[mode]
+
+    def top(self, mode: str, k: int = 10, offset: int = 0,
+            depth: Optional[int] = None) -> List[Tuple[int, float]]:
+        """The ids and scores of the best ranked articles."""
+        scores = self.scores(mode)
+        mask = self.ranked & (scores > 0)
+        if mode != 'pagerank':
+            # An article is trivially related to itself.
+            mask &= self.depth != 1
+        if depth is not None:
+            mask &= self.depth == depth
+        candidates = np.flatnonzero(mask)
+        end = min(offset + k, len(candidates))
+        if offset >= end:
+            return []
+        # Only sorts the candidates of the page and the ones before it.
+        values = -scores[candidates]
+        best = np.argpartition(values, end - 1)[:end]
+        best = best[np.lexsort((candidates[best], values[best]))][offset:end]
+        return [(int(candidates[i]), float(scores[candidates[i]]))
+                for i in best]
+
+
+class GraphCache:
+    """The graph of a store, rebuilt once per generation of the store.
+
+    It can be shared between threads, the graph being built by the first of
+    them asking for a new generation.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.generation = None
+        self._graph = None
+        self._lock = threading.Lock()
+
+    def get(self, generation: int) -> CitationGraph:
+        with self._lock:
+            if self._graph is None or self.generation != generation:
+                start = time.perf_counter()
+                db = store.CitationStore(self.filename)
+                try:
+                    self._graph = CitationGraph.from_store(db)
+                finally:
+                    db.close()
+                self.generation = generation
+                logging.info(f'Built the graph of {len(self._graph)} articles '
+                             f'in {time.perf_counter() - start:.2f}s')
+            return self._graph
+
+    def top(self, generation: int, mode: str, k: int = 10, offset: int = 0,
+            depth: Optional[int] = None) -> List[Tuple[int, float]]:
+        graph = self.get(generation)
+        with self._lock:
+            return graph.top(mode, k, offset, depth)
@@ -0,0 +1,108 @@
+"""Canonical identities of the articles.
+
+A same article reaches the scraper under several urls: with or without a
+trailing slash, with a query string, or as its PubMed and its PMC page. Each
+of them is reduced to a key, 'pmid:<PMID>' or 'pmcid:<PMCID>', and the
+articles are queued under a single canonical url.
+"""
+
+import re
+from typing import List, Optional
+import urllib.parse
+
+from bibliographer import citation
+
+PUBMED_HOST = 'pubmed.ncbi.nlm.nih.gov'
+PMC_PATH = '/pmc/articles/'
+PMC_HOSTS = ('www.ncbi.nlm.nih.gov', 'ncbi.nlm.nih.gov',
+             'pmc.ncbi.nlm.nih.gov')
+
+PMID_REGEX = re.compile(r'^[0-9]+$')
+PMCID_REGEX = re.compile(r'^(?:PMC)?([0-9]+)$', re.IGNORECASE)
+
+
+def normalize_pmid(pmid: Optional[str]) -> str:
+    return (pmid or '').strip()
+
+
+def normalize_pmcid(pmcid: Optional[str]) -> str:
+    pmcid = (pmcid or '').strip()
+    match = PMCID_REGEX.match(pmcid)
+    return f'PMC{match.group(1)}' if match is not None else pmcid
+
+
+def pubmed_url(pmid: str) -> str:
+    return f'https://{PUBMED_HOST}/{pmid}/'
+
+
+def pmc_url(pmcid: str) -> str:
+    return f'https://www.ncbi.nlm.nih.gov{PMC_PATH}{pmcid}/'
+
+
+def parse_url(url: Optional[str]):
+    """Returns the (pmid, pmcid) found in a PubMed or PMC url."""
+    parts = urllib.parse.urlsplit((url or '').strip())
+    host = parts.netloc.lower()
+    path = parts.path
+    if host == PUBMED_HOST:
+        pmid = path.strip('/').split('/')[0]
+        return (pmid if PMID_REGEX.match(pmid) else ''), ''
+    if host in PMC_HOSTS:
+        if path.startswith('/pmc/'):
+            path = path[len('/pmc'):]
+        if path.startswith('/articles/'):
+            pmcid = path.split('/')[2]
+            return '', (normalize_pmcid(pmcid) if PMCID_REGEX.match(pmcid) else '')
+    return '', ''
+
+
+def canonical_url(url: Optional[str]) -> str:
+    """The canonical form of a PubMed or PMC url, other urls are kept."""
+    pmid, pmcid = parse_url(url)
+    if pmid:
+        return pubmed_url(pmid)
+    if pmcid:
+        return pmc_url(pmcid)
+    return (url or '').strip()
+
+
+def url_key(url: Optional[str]) -> str:
+    """The key of the article behind a url."""
+    pmid, pmcid = parse_url(url)
+    if pmid:
+        return f'pmid:{pmid}'
+    if pmcid:
+        return f'pmcid:{pmcid}'
+    url = (url or '').strip()
+    return f'url:{url.rstrip("/")}' if url else ''
+
+
+def keys(cite: citation.Citation) -> List[str]:
+    """All the keys of an article, from its ids and its urls."""
+    result = []
+    pmid = normalize_pmid(cite.pmid)
+    if pmid:
+        result.append(f'pmid:{pmid}')
+    pmcid = normalize_pmcid(cite.pmcid)
+    if pmcid:
+        result.append(f'pmcid:{pmcid}')
+    for url in (cite.pm_url, cite.pmc_url):
+        key = url_key(url)
+        if key and key not in result:
+            result.append(key)
+    return result
+
+
+def urls(cite: citation.Citation) -> List[str]:
+    """The canonical urls of an article, its PubMed page first."""
+    return [canonical_url(url) for url in (cite.pm_url, cite.pmc_url) if url]
+
+
+def normalize(cite: citation.Citation):
+    """Puts the ids and the urls of a citation in their canonical form."""
+    cite.pmid = normalize_pmid(cite.pmid) or parse_url(cite.pm_url)[0]
+    cite.pmcid = normalize_pmcid(cite.pmcid) or parse_url(cite.pmc_url)[1]
+    if cite.pm_url:
+        cite.pm_url = canonical_url(cite.pm_url)
+    if cite.pmc_url:
+        cite.pmc_url = canonical_url(cite.pmc_url)
@@ -0,0 +1,248 @@
+"""Counters, gauges and latency histograms, in the Prometheus text format.
+
+The metrics are registered once, at import time, in a process wide registry
+and are updated from any thread. `render` returns all of them as text.
+
+`sample_stacks` is a sampling profiler: it records the stacks of all the
+threads at a regular interval and returns the hottest ones.
+
+`MetricsHandler` and `ProfileHandler` serve them over HTTP, in the server as
+well as in the scraper.
+"""
+
+import bisect
+import collections
+import contextlib
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import tornado.ioloop
+import tornado.web
+
+# In seconds, from a cached lookup in the db to a page load in a browser.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+           5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    labels = ','.join(f'{n}="{v}"' for n, v in zip(names, values))
+    return f'{{{labels}}}'
+
+
+class Metric:
+    """A metric, with a value per combination of its labels."""
+
+    TYPE = ''
+
+    def __init__(self, name: str, description: str,
+                 labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def labels(self, *values) -> 'Child':
+        return Child(self, tuple(str(v) for v in values))
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """The (suffix, labels, value) of each of the samples."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.description}',
+                 f'# TYPE {self.name} {self.TYPE}']
+        for suffix, labels, value in self.samples():
+            lines.append(f'{self.name}{suffix}{labels} {value:g}')
+        return '\n'.join(lines)
+
+
+class Child:
+    """A metric bound to the values of its labels."""
+
+    def __init__(self, metric: Metric, values: Tuple[str, ...]):
+        self._metric = metric
+        self._values = values
+
+    def inc(self, amount: float = 1.0):
+        self._metric.inc(amount, self._values)
+
+    def observe(self, value: float):
+        self._metric.observe(value, self._values)
+
+    def time(self):
+        return self._metric.time(self._values)
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1.0, labels: Tuple[str, ...] = ()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [('_total', format_labels(self.label_names, labels), value)
+                for labels, value in values]
+
+
+class Gauge(Metric):
+    """A gauge, read from a function when rendered."""
+
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._read = None
+
+    def set_function(self, read: Optional[Callable[[], float]]):
+        self._read = read
+
+    def samples(self):
+        read = self._read
+        if read is None:
+            return []
+        try:
+            return [('', '', float(read()))]
+        except Exception as e:
+            logging.error(f'Cannot read {self.name}: {e}')
+            return []
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, description: str,
+                 labels: Sequence[str] = (), buckets: Sequence[float] = BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # The counts of the buckets and +Inf, then the sum.
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, labels: Tuple[str, ...] = ()):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((k, list(v)) for k, v in self._values.items())
+        result = []
+        for labels, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                total += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                names = self.label_names + ('le',)
+                result.append(
+                    ('_bucket', format_labels(names, labels + (le,)), total))
+            tags = format_labels(self.label_names, labels)
+            result.append(('_sum', tags, counts[-1]))
+            result.append(('_count', tags, total))
+        return result
+
+
+class Registry:
+    """The metrics of a process, by name."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        return '\n'.join(m.render() for m in self._metrics.values()) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, description: str, labels: Sequence[str] = ()):
+    return REGISTRY.register(Counter(name, description, labels))
+
+
+def gauge(name: str, description: str):
+    return REGISTRY.register(Gauge(name, description))
+
+
+def histogram(name: str, description: str, labels: Sequence[str] = (),
+              buckets: Sequence[float] = BUCKETS):
+    return REGISTRY.register(Histogram(name, description, labels, buckets))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def sample_stacks(duration: float = 5.0, interval: float = 0.005,
+                  top: int = 20) -> str:
+    """Samples the stacks of the other threads, returns the hottest ones.
+
+    Each stack is given on a line, with its frames separated by semicolons
+    and followed by the number of samples, as in the folded format of the
+    flame graphs.
+    """
+    me = threading.get_ident()
+    stacks = collections.Counter()
+    samples = 0
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            frames = traceback.extract_stack(frame)
+            stacks[';'.join(f'{f.name} ({f.filename}:{f.lineno})'
+                            for f in frames)] += 1
+        samples += 1
+        time.sleep(interval)
+
+    lines = [f'# {samples} samples over {duration:g}s']
+    lines.extend(f'{stack} {count}' for stack, count in stacks.most_common(top))
+    return '\n'.join(lines) + '\n'
+
+
+def log_stacks(duration: float = 5.0):
+    """Logs the hottest stacks, from a thread of its own."""
+    def run():
+        logging.info(f'Hot stacks:\n{sample_stacks(duration)}')
+    threading.Thread(target=run, daemon=True).start()
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """The metrics of the process, in the Prometheus text format."""
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.write(render())
+
+
+class ProfileHandler(tornado.web.RequestHandler):
+    """Samples the stacks of the process for a few seconds."""
+
+    async def get(self):
+        seconds = min(float(self.get_argument('seconds', 5)), 60)
+        loop = tornado.ioloop.IOLoop.current()
+        # Samples from a thread, so that the event loop shows in the stacks.
+        stacks = await loop.run_in_executor(None, sample_stacks, seconds)
+        self.set_header('Content-Type', 'text/plain')
+        self.write(stacks)
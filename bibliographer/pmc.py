@@ -5,52 +5,82 @@ import logging
 import urllib.parse
 
 import lxml
+import lxml.etree
 import lxml.html
 
+from typing import Optional
+
 import selenium.common.exceptions
-from selenium import webdriver
-from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
+import tornado.ioloop
 
+from bibliographer import browser
 from bibliographer import citation
 
 
+# The XPath expressions are compiled once for all the pages, the links of each
+# reference are only searched in its subtree.
+TITLE = lxml.etree.XPath('descendant::*[@class="content-title"]/text()')
+EDITION = lxml.etree.XPath(
+    'descendant::div[@class="citation-default"]/div[@class="part1"]')
+FM_EDITION = lxml.etree.XPath('descendant::*[@class="fm-citation"]/*/span')
+FM_YEAR_VOLUME = lxml.etree.XPath(
+    'descendant::*[@class="fm-vol-iss-date"]/a/text()')
+PMID = lxml.etree.XPath('descendant::*[@class="fm-citation-pmid"]/*/text()')
+PMCID = lxml.etree.XPath(
+    'descendant::*[@class="fm-citation-pmcid"]/span/text()')
+AUTHORS = lxml.etree.XPath(
+    'descendant::div[@class="contrib-group fm-author"]/a/text()')
+AFFILIATIONS = lxml.etree.XPath('descendant::div[@class="fm-affl"]/text()')
+ABSTRACT_H2 = lxml.etree.XPath('descendant::h2[text()[1] = "Abstract"]')
+ABSTRACT = lxml.etree.XPath('../div/p')
+REFERENCES = lxml.etree.XPath('//li/span[@class="mixed-citation"]')
+REFERENCE_LINKS = lxml.etree.XPath('descendant::a')
+
+# What the browser waits for before the page is read.
+READY = EC.presence_of_element_located((By.CLASS_NAME, 'content-title'))
+
+
 class PMCFetcher:
     """Fetches and parses PMC HTML."""
 
+    NAME = 'pmc'
     URL_PREFIX = 'www.ncbi.nlm.nih.gov/pmc/articles'
 
-    def __init__(self):
-        self._browser = webdriver.Chrome()
+    def __init__(self, options: Optional[browser.BrowserOptions] = None):
+        # The browser is only started on the first fetch.
+        self.browser = browser.BrowserSession(options)
 
     def stop(self):
-        self._browser.close()
+        self.browser.stop()
 
     @classmethod
     def matches(cls, url: str) -> bool:
         return cls.URL_PREFIX in url
 
     async def fetch(self, url: str) -> str:
+        """Runs the blocking browser calls off the event loop."""
+        loop = tornado.ioloop.IOLoop.current()
+        return await loop.run_in_executor(None, self.fetch_page, url)
+
+    def fetch_page(self, url: str) -> str:
         logging.info(f'Fetching: {url}')
-        self._browser.get(url)
-        condition = EC.presence_of_element_located(
-                (By.XPATH, '//*[@class="content-title"]'))
-        WebDriverWait(self._browser, 10).until(condition)
-        return self._browser.page_source
+        self.browser.get(url)
+        self.browser.wait(READY)
+        return self.browser.page_source
 
     def get_edition(self, etree):
-        edition = etree.xpath(
-            '//div[@class="citation-default"]/div[@class="part1"]')
+        edition = EDITION(etree)
         if edition:
             edition = edition[0]
         else:
-            edition = etree.xpath('//*[@class="fm-citation"]/*/span')[0]
+            edition = FM_EDITION(etree)[0]
 
         journal = edition.getchildren()[0].text_content()
         year_volume = edition.getchildren()[0].tail
         if not year_volume:
-            year_volume = etree.xpath('//*[@class="fm-vol-iss-date"]/a/text()')
+            year_volume = FM_YEAR_VOLUME(etree)
             if year_volume:
                 year_volume = year_volume[0][len(journal) + 1:]
 
@@ -62,25 +92,21 @@ class PMCFetcher:
         """Parses an HTML from PMC into a Citation entry."""
         result = citation.Citation()
         etree = lxml.html.fromstring(html)
-        result.title = etree.xpath('//*[@class="content-title"]/text()')[0]
+        result.title = TITLE(etree)[0]
         result.journal, result.year, result.volume = self.get_edition(etree)
-        result.pmid = etree.xpath('//*[@class="fm-citation-pmid"]/*/text()')[0]
-        result.pmcid = etree.xpath('//*[@class="fm-citation-pmcid"]/span/text()')[-1]
-        result.authors = etree.xpath('//div[@class="contrib-group fm-author"]/a/text()')
-        result.affiliations = etree.xpath('//div[@class="fm-affl"]/text()')
+        result.pmid = PMID(etree)[0]
+        result.pmcid = PMCID(etree)[-1]
+        result.authors = AUTHORS(etree)
+        result.affiliations = AFFILIATIONS(etree)
 
         # For abstract finds the abstract h2 first.
-        h2s = etree.xpath('//h2')
-        for h2 in h2s:
-            texts = h2.xpath('text()')
-            if texts and texts[0] == 'Abstract':
-                abstract = h2.getparent().xpath('div/p')
-                if abstract:
-                    result.abstract = abstract[0].text_content()
-
-        refs = etree.xpath('//li/span[@class="mixed-citation"]')
-        for ref in refs:
-            links = {x.text: x.attrib['href'] for x in ref.xpath('.//a')}
+        for h2 in ABSTRACT_H2(etree):
+            abstract = ABSTRACT(h2)
+            if abstract:
+                result.abstract = abstract[0].text_content()
+
+        for ref in REFERENCES(etree):
+            links = {x.text: x.attrib['href'] for x in REFERENCE_LINKS(ref)}
             curr = citation.Citation()
 
             google_url = links.get('Google Scholar', None)
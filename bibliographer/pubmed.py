@@ -11,16 +11,51 @@ from typing import Any, List, Optional
 import urllib.parse
 
 import lxml
+import lxml.etree
 import lxml.html
 import selenium.common.exceptions
-from selenium import webdriver
-from selenium.webdriver.support.wait import WebDriverWait
+import tornado.ioloop
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 
+from bibliographer import browser
 from bibliographer import citation
 
 
+# The XPath expressions and the regex are compiled once for all the pages.
+# Elements with an id are looked up with id(), which does not scan the page,
+# and the cited-by and reference entries are only searched in their subtree.
+TITLE = lxml.etree.XPath('descendant::h1[@class="heading-title"]/text()')
+AUTHORS = lxml.etree.XPath(
+    'descendant::div[@class="inline-authors"]'
+    '/descendant::span[@class=$cls]/a/text()')
+ABSTRACT = lxml.etree.XPath('descendant::div[@class="abstract"]/div/p')
+PMID = lxml.etree.XPath(
+    'descendant::span[@class="identifier pubmed"]/strong/text()')
+PMCID = lxml.etree.XPath('descendant::span[@class="identifier pmc"]/a')
+JOURNAL = lxml.etree.XPath('id("full-view-journal-trigger")/text()')
+YEAR_VOLUME = lxml.etree.XPath(
+    'descendant::span[@class="cit"][parent::*[@class="article-source"]]'
+    '/text()')
+CITED_BY = lxml.etree.XPath('id("citedby-articles-list")/li/div')
+CITED_BY_TITLE = lxml.etree.XPath('descendant::a[@class="docsum-title"]')
+CITED_BY_AUTHORS = lxml.etree.XPath(
+    'descendant::span[@class="docsum-authors full-authors"]/text()')
+CITED_BY_PMID = lxml.etree.XPath(
+    'descendant::span[@class="docsum-pmid"]/text()')
+REFERENCES = lxml.etree.XPath(
+    'id("references")[self::div]/descendant::ol[@class="references-list"]'
+    '/descendant::li[@class="skip-numbering"]')
+REFERENCE_LINKS = lxml.etree.XPath('descendant::a[@class="reference-link"]')
+REFERENCE_REGEX = re.compile(r'([\w\.,\s]+)\s\(([0-9]+)\)\.\s(.*)')
+
+# What the browser waits for before the page is read.
+READY = EC.presence_of_element_located((By.CSS_SELECTOR, 'h1.heading-title'))
+SHOW_REFERENCES = (By.XPATH, '//*[@id="top-references-list"]/div/div/button')
+ALL_REFERENCES = EC.presence_of_element_located(
+    (By.XPATH, '//*[@id="top-references-list-1"]/li[6]/ol/li'))
+
+
 def to_url(pmid: str):
     return f'https://pubmed.ncbi.nlm.nih.gov/{pmid}/'
 
@@ -28,54 +63,59 @@ def to_url(pmid: str):
 class PubmedFetcher:
     """Fetches and parses PubMed HTML."""
 
-    def __init__(self):
-        self._browser = webdriver.Chrome()
+    NAME = 'pubmed'
+
+    def __init__(self, options: Optional[browser.BrowserOptions] = None):
+        # The browser is only started on the first fetch.
+        self.browser = browser.BrowserSession(options)
 
     def stop(self):
-        self._browser.close()
+        self.browser.stop()
 
     @staticmethod
     def matches(url: str) -> bool:
         return 'pubmed.ncbi.nlm.nih.gov' in url
 
     async def fetch(self, url: str) -> str:
+        """Runs the blocking browser calls off the event loop."""
+        loop = tornado.ioloop.IOLoop.current()
+        return await loop.run_in_executor(None, self.fetch_page, url)
+
+    def fetch_page(self, url: str) -> str:
         """Clicks on show all references and returns full html"""
         # TODO(oliviert): migrate to arsenic
         logging.info(f'Fetching: {url}')
-        self._browser.get(url)
+        self.browser.get(url)
+        self.browser.wait(READY)
         try:
-            button = self._browser.find_element_by_xpath(
-                '//*[@id="top-references-list"]/div/div/button')
+            button = self.browser.driver.find_element(*SHOW_REFERENCES)
             button.click()
-            condition = EC.presence_of_element_located(
-                (By.XPATH, '//*[@id="top-references-list-1"]/li[6]/ol/li'))
-            WebDriverWait(self._browser, 10).until(condition)
+            self.browser.wait(ALL_REFERENCES)
         except selenium.common.exceptions.NoSuchElementException as e:
             logging.error(f'{url} has no references.')
-        return self._browser.page_source
+        return self.browser.page_source
 
     def parse(self, html: str) -> citation.Citation:
         """Parse a page from PubMed and returns a Citation."""
         etree = lxml.html.fromstring(html)
         result = citation.Citation()
 
-        result.title = etree.xpath('//h1[@class="heading-title"]/text()')[0].strip()
-        result.authors = etree.xpath('//div[@class="inline-authors"]//span[@class="authors-list-item"]/a/text()')
+        result.title = TITLE(etree)[0].strip()
+        result.authors = AUTHORS(etree, cls='authors-list-item')
         if not result.authors:
-            result.authors = etree.xpath('//div[@class="inline-authors"]//span[@class="authors-list-item "]/a/text()')
+            result.authors = AUTHORS(etree, cls='authors-list-item ')
 
-        abstract = etree.xpath("//div[@class='abstract']/div/p")
+        abstract = ABSTRACT(etree)
         if abstract:
             result.abstract = abstract[0].text_content().strip()
 
-        result.pmid = etree.xpath('//span[@class="identifier pubmed"]/strong/text()')[0].strip()
-        pmcid = etree.xpath('//span[@class="identifier pmc"]/a')
+        result.pmid = PMID(etree)[0].strip()
+        pmcid = PMCID(etree)
         if pmcid:
             result.pmcid = pmcid[0].text.strip() if pmcid else ''
             result.pmc_url = pmcid[0].attrib['href']
-        result.journal = etree.xpath('//*[@id="full-view-journal-trigger"]/text()')[0].strip()
-        year_volume = etree.xpath(
-            '//*[@class="article-source"]/span[@class="cit"]/text()')[0].split(';')
+        result.journal = JOURNAL(etree)[0].strip()
+        year_volume = YEAR_VOLUME(etree)[0].split(';')
         if len(year_volume) > 1:
             result.year, result.volume = year_volume
         else:
@@ -83,27 +123,21 @@ class PubmedFetcher:
             result.year = parts[0]
             result.volume = ' '.join(parts[1:])
 
-        cited_by_elems = etree.xpath('//*[@id="citedby-articles-list"]/li/div')
-        for elem in cited_by_elems:
+        for elem in CITED_BY(etree):
             curr = citation.Citation()
-            title = elem.xpath('.//a[@class="docsum-title"]')[0]
+            title = CITED_BY_TITLE(elem)[0]
             curr.title = title.text.strip()
             curr.pm_url = title.attrib['href']
             if curr.pm_url.startswith('/'):
                 curr.pm_url = f'https://pubmed.ncbi.nlm.nih.gov{curr.pm_url}'
-            authors = elem.xpath(
-                './/span[@class="docsum-authors full-authors"]/text()')
-            curr.authors = authors[0].strip().split(', ')
-            curr.pmid = elem.xpath(
-                './/span[@class="docsum-pmid"]/text()')[0].strip()
+            curr.authors = CITED_BY_AUTHORS(elem)[0].strip().split(', ')
+            curr.pmid = CITED_BY_PMID(elem)[0].strip()
             result.cited_by.append(curr)
 
-        references = etree.xpath('//div[@id="references"]//ol[@class="references-list"]//li[@class="skip-numbering"]')
-        for elem in references:
+        for elem in REFERENCES(etree):
             curr = citation.Citation()
             ref = elem.text.strip().strip('-').strip()
-            regex = r'([\w\.,\s]+)\s\(([0-9]+)\)\.\s(.*)'
-            match = re.search(regex, ref)
+            match = REFERENCE_REGEX.search(ref)
             if match is not None:
                 curr.authors = match.group(1).split(', ')
                 curr.year = match.group(2)
@@ -112,7 +146,7 @@ class PubmedFetcher:
                 curr.title = ref
 
             links = {a.text.strip(): a.attrib['href']
-                    for a in elem.xpath('.//a[@class="reference-link"]')}
+                    for a in REFERENCE_LINKS(elem)}
 
             link = links.get('PMC', None)
             if link is not None:
@@ -0,0 +1,27 @@
+"""A per-host rate limiter for the fetchers."""
+
+import time
+import urllib.parse
+
+from tornado import gen
+
+
+class HostRateLimiter:
+    """Spaces out the requests sent to a same host.
+
+    Each call reserves the next free slot for its host, so that concurrent
+    workers hitting the same host are served one after the other, at most once
+    every `min_delay` seconds.
+    """
+
+    def __init__(self, min_delay: float = 1.0):
+        self.min_delay = min_delay
+        self._next_slot = {}
+
+    async def wait(self, url: str):
+        host = urllib.parse.urlparse(url).netloc
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.min_delay
+        if slot > now:
+            await gen.sleep(slot - now)
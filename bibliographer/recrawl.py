@@ -0,0 +1,98 @@
+"""Chooses the stored articles to fetch again, to keep their citations fresh.
+
+An article is only fetched once by a crawl, while the papers citing it keep
+coming. Fetching all of them again is as long as the crawl itself, so only
+the ones most likely to have new cited-by entries are.
+
+The cited-by entries of an article are assumed to arrive at a steady rate.
+Before the article has been fetched twice, that rate is guessed from its
+number of cited-by entries and its age: the recent and highly cited articles
+are the ones gaining citations. Each fetch then adds to what is known of it:
+the rate is the number of new entries found, plus `prior_days` of the guess,
+over the time between the first and the last fetches, plus `prior_days`.
+
+The priority of an article is the number of new entries expected since its
+last fetch, divided by its depth, so that the ones closer to the seeds, which
+matter more to the rankings, come first.
+"""
+
+import datetime
+import heapq
+import re
+import time
+from typing import List, Optional, Tuple
+
+from bibliographer import store
+
+DAY = 86400.0
+# The age of the articles without a publication year.
+DEFAULT_AGE_DAYS = 3650.0
+# The articles of the year are not younger than that.
+MIN_AGE_DAYS = 180.0
+
+_YEAR = re.compile(r'\b(1[89]|20)\d\d\b')
+
+
+def age_days(year: str, now: float) -> float:
+    """The number of days since the start of the publication year."""
+    match = _YEAR.search(year or '')
+    if match is None:
+        return DEFAULT_AGE_DAYS
+    published = datetime.datetime(
+        int(match.group()), 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+    return max((now - published) / DAY, MIN_AGE_DAYS)
+
+
+class RecrawlScheduler:
+    """Ranks the stored articles by their expected number of new citations.
+
+    The articles fetched less than `min_age` days ago are left alone. The
+    ones whose last fetch was not recorded are deemed `horizon` days old.
+    """
+
+    def __init__(self,
+                 min_age: float = 7.0,
+                 horizon: float = 365.0,
+                 prior_days: float = 90.0):
+        self.min_age = min_age
+        self.horizon = horizon
+        self.prior_days = prior_days
+
+    def rate(self, year: str, cited_by: int, first_fetched: Optional[float],
+             fetched_at: Optional[float], new_cited_by: int,
+             now: float) -> float:
+        """The expected number of new cited-by entries per day."""
+        guess = (cited_by + 1) / age_days(year, now)
+        observed = 0.0
+        if first_fetched is not None:
+            observed = (fetched_at - first_fetched) / DAY
+        return ((new_cited_by + self.prior_days * guess) /
+                (observed + self.prior_days))
+
+    def priority(self, depth: int, year: str, cited_by: int,
+                 first_fetched: Optional[float], fetched_at: Optional[float],
+                 new_cited_by: int, now: float) -> float:
+        """The expected new cited-by entries of an article, by its depth.
+
+        It is 0 for the articles fetched too recently.
+        """
+        elapsed = self.horizon
+        if fetched_at is not None:
+            elapsed = (now - fetched_at) / DAY
+            if elapsed < self.min_age:
+                return 0.0
+        rate = self.rate(year, cited_by, first_fetched, fetched_at,
+                         new_cited_by, now)
+        return rate * elapsed / max(depth, 1)
+
+    def choose(self, db: store.CitationStore, n: int,
+               now: Optional[float] = None) -> List[Tuple[str, int, float]]:
+        """The (url, depth, priority) of the n articles to fetch first."""
+        now = time.time() if now is None else now
+        candidates = (
+            (self.priority(depth, year, cited_by, first_fetched, fetched_at,
+                           new_cited_by, now), url, depth)
+            for url, depth, year, cited_by, first_fetched, fetched_at,
+            new_cited_by in db.fetch_history())
+        return [(url, depth, priority) for priority, url, depth in
+                heapq.nlargest(n, candidates) if priority > 0]
@@ -0,0 +1,65 @@
+"""Parses the archived pages again and rewrites their citations.
+
+The pages are parsed in a pool of processes, the citations are written back
+to the store in batches. The depth and the translations of the stored
+citations are kept.
+"""
+
+import concurrent.futures
+import logging
+from typing import Optional, Tuple
+
+from bibliographer import archive
+from bibliographer import citation
+from bibliographer import scraper
+from bibliographer import store
+
+
+def parse(root: str, url: str, digest: str, kind: str
+          ) -> Tuple[str, Optional[citation.Citation]]:
+    """Parses an archived page, in a worker process."""
+    try:
+        page = archive.PageArchive.read(root, digest)
+        return url, scraper.parse_page(kind, page)
+    except Exception as e:
+        logging.error(f'Cannot parse {url}: {e}')
+        return url, None
+
+
+def merge(old: Optional[citation.Citation], new: citation.Citation):
+    """Keeps what was not parsed from the page in the new citation."""
+    if old is None:
+        return
+    new.depth = old.depth
+    if new.title == old.title:
+        new.title_fr = old.title_fr
+    if new.abstract == old.abstract:
+        new.abstract_fr = old.abstract_fr
+
+
+def reparse(db: store.CitationStore,
+            pages: archive.PageArchive,
+            processes: Optional[int] = None,
+            batch_size: int = 1000) -> int:
+    """Parses all the archived pages, returns the number of citations."""
+    count = 0
+    batch = []
+    entries = list(pages.pages())
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        results = pool.map(
+            parse,
+            [pages.root] * len(entries),
+            *zip(*entries),
+            chunksize=64)
+        for url, cite in results:
+            if cite is None:
+                continue
+            merge(db.get(url), cite)
+            batch.append((url, cite))
+            if len(batch) == batch_size:
+                db.put_many(batch)
+                count += len(batch)
+                batch = []
+                logging.info(f'Parsed {count} / {len(entries)} pages.')
+    db.put_many(batch)
+    return count + len(batch)
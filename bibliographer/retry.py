@@ -0,0 +1,179 @@
+"""Retries of the failed urls, and circuit breakers for the failing hosts."""
+
+import collections
+import heapq
+import itertools
+import random
+import time
+import urllib.parse
+from typing import Dict, List, Optional, Tuple
+
+import selenium.common.exceptions
+from tornado import httpclient
+
+from bibliographer import metrics
+
+RETRIES = metrics.counter(
+    'bibliographer_retries', 'Failed urls scheduled for a retry, by failure.',
+    ['failure'])
+GIVEUPS = metrics.counter(
+    'bibliographer_giveups', 'Urls given up after their last attempt.',
+    ['failure'])
+OPEN_HOSTS = metrics.gauge(
+    'bibliographer_open_hosts', 'Hosts paused by their circuit breaker.')
+
+
+class ParseError(Exception):
+    """A fetched page which could not be parsed."""
+
+
+def classify(error: BaseException) -> str:
+    """The class of a failure, to count them and to pick their retries."""
+    if isinstance(error, ParseError):
+        return 'parse'
+    if isinstance(error, (TimeoutError,
+                          selenium.common.exceptions.TimeoutException)):
+        return 'timeout'
+    if isinstance(error, httpclient.HTTPClientError):
+        return 'timeout' if error.code == 599 else f'http_{error.code}'
+    if isinstance(error, selenium.common.exceptions.WebDriverException):
+        return 'browser'
+    if isinstance(error, (ConnectionError, OSError)):
+        return 'network'
+    return type(error).__name__
+
+
+# Those fail the same way on every attempt.
+PERMANENT = ('http_400', 'http_404', 'http_410')
+
+
+class RetryScheduler:
+    """Holds the failed urls until their next attempt.
+
+    The delay before the n-th retry of a url is `base_delay * 2^(n-1)`, up to
+    `max_delay`, with some jitter so that the urls failed together are not
+    retried together. A url fails for good after `max_attempts` attempts, or
+    at once on a permanent failure.
+    """
+
+    def __init__(self,
+                 base_delay: float = 30.0,
+                 max_delay: float = 3600.0,
+                 max_attempts: int = 4,
+                 jitter: float = 0.2):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.jitter = jitter
+        self._heap = []
+        self._counter = itertools.count()
+        self._attempts: Dict[str, int] = {}
+        self._waiting = collections.Counter()
+        self.failures = collections.Counter()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._waiting
+
+    def attempts(self, url: str) -> int:
+        return self._attempts.get(url, 0)
+
+    def delay(self, attempts: int) -> float:
+        delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def failed(self, depth: int, url: str, failure: str) -> bool:
+        """Schedules the retry of a failed url, False when giving up."""
+        self.failures[failure] += 1
+        attempts = self._attempts.get(url, 0) + 1
+        if failure in PERMANENT or attempts >= self.max_attempts:
+            self._attempts.pop(url, None)
+            GIVEUPS.labels(failure).inc()
+            return False
+
+        self._attempts[url] = attempts
+        RETRIES.labels(failure).inc()
+        self.defer(depth, url, time.monotonic() + self.delay(attempts))
+        return True
+
+    def defer(self, depth: int, url: str, due: float):
+        """Holds a url until a given time, without counting an attempt."""
+        heapq.heappush(self._heap, (due, next(self._counter), depth, url))
+        self._waiting[url] += 1
+
+    def succeeded(self, url: str):
+        self._attempts.pop(url, None)
+
+    def next_due(self) -> Optional[float]:
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: Optional[float] = None) -> List[Tuple[int, str]]:
+        """The (depth, url) due for a retry."""
+        now = time.monotonic() if now is None else now
+        result = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, depth, url = heapq.heappop(self._heap)
+            self._waiting[url] -= 1
+            if not self._waiting[url]:
+                del self._waiting[url]
+            result.append((depth, url))
+        return result
+
+
+class CircuitBreaker:
+    """Pauses the hosts which keep failing.
+
+    After `threshold` failures in a row, a host is open: its urls are not
+    fetched for `cooldown` seconds. The next url is then let through: if it
+    fails as well, the host is paused again for twice as long, up to
+    `max_cooldown`, while a success closes it.
+    """
+
+    def __init__(self,
+                 threshold: int = 5,
+                 cooldown: float = 60.0,
+                 max_cooldown: float = 1800.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._failures = collections.Counter()
+        self._open_until: Dict[str, float] = {}
+        self._cooldowns: Dict[str, float] = {}
+        OPEN_HOSTS.set_function(self.num_open)
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urllib.parse.urlsplit(url).netloc
+
+    def num_open(self) -> int:
+        now = time.monotonic()
+        return sum(until > now for until in self._open_until.values())
+
+    def reopens_at(self, url: str) -> Optional[float]:
+        """When a paused host is let through again, None if it is not."""
+        until = self._open_until.get(self.host(url))
+        if until is None or until <= time.monotonic():
+            return None
+        return until
+
+    def succeeded(self, url: str):
+        host = self.host(url)
+        self._failures.pop(host, None)
+        self._open_until.pop(host, None)
+        self._cooldowns.pop(host, None)
+
+    def failed(self, url: str):
+        host = self.host(url)
+        self._failures[host] += 1
+        if self._failures[host] < self.threshold:
+            return
+
+        cooldown = self._cooldowns.get(host)
+        cooldown = self.cooldown if cooldown is None else min(
+            2 * cooldown, self.max_cooldown)
+        self._cooldowns[host] = cooldown
+        self._open_until[host] = time.monotonic() + cooldown
+        # Lets a single url through once the host reopens.
+        self._failures[host] = self.threshold - 1
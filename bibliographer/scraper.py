@@ -1,64 +1,301 @@
 """Keep scraping the references from pubmed."""
 
+import concurrent.futures
 import logging
+import multiprocessing
 from typing import Optional, List
-import shelve
 import signal
 import sys
+import time
 
-from tornado import queues
+import tornado.gen
 import tornado.ioloop
+import tornado.web
 
+from bibliographer import archive
+from bibliographer import browser
 from bibliographer import pmc
 from bibliographer import pubmed
 from bibliographer import citation
+from bibliographer import eutils
+from bibliographer import frontier
+from bibliographer import identity
+from bibliographer import metrics
+from bibliographer import ratelimit
+from bibliographer import recrawl
+from bibliographer import retry
+from bibliographer import store
+from bibliographer import writer
+
+
+# The fetchers, by name, to parse the pages they fetched.
+FETCHERS = {f.NAME: f for f in (
+    pubmed.PubmedFetcher, pmc.PMCFetcher, eutils.EutilsFetcher)}
+_parsers = {}
+
+FETCH_SECONDS = metrics.histogram(
+    'bibliographer_fetch_seconds', 'Time to fetch a page.', ['fetcher'])
+PARSE_SECONDS = metrics.histogram(
+    'bibliographer_parse_seconds', 'Time to parse a page.')
+PAGES = metrics.counter(
+    'bibliographer_pages', 'Urls taken from the queue, by outcome.',
+    ['outcome'])
+QUEUE_DEPTH = metrics.gauge(
+    'bibliographer_queue_depth', 'Urls waiting in the queue.')
+IN_FLIGHT = metrics.gauge(
+    'bibliographer_in_flight', 'Urls being processed.')
+
+
+def parse_with(cls, page: str) -> citation.Citation:
+    """Parses a page with a fetcher of the given class, without fetching."""
+    if cls not in _parsers:
+        _parsers[cls] = cls()
+    return _parsers[cls].parse(page)
+
+
+def parse_page(kind: str, page: str) -> citation.Citation:
+    """Parses a page with the fetcher of the given kind, without fetching."""
+    return parse_with(FETCHERS[kind], page)
+
+
+def ignore_signals():
+    """The parsing processes leave the signals to the scraper."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGQUIT, signal.SIG_DFL)
 
 
 class BiblioScraper:
-    """An async scraper."""
+    """An async scraper.
+
+    The queue is drained by `workers` concurrent workers, each of them owning
+    its own fetchers, so that several pages can be loaded at the same time.
+    Requests to a same host are spaced out by at least `min_delay` seconds.
+
+    The `backend` selects how the pages are fetched: 'browser' drives a Chrome
+    instance per worker with the `browser_options`, 'eutils' queries the NCBI
+    E-utilities at `eutils_url` over HTTP, with a fetcher shared by all the
+    workers so that their requests are batched.
+
+    Each url is queued once, the most referenced ones first. With `max_seen`,
+    the seen urls are remembered approximately in a Bloom filter sized for
+    that many of them, rather than in a set. The pending urls are checkpointed
+    in the db, and reloaded from there when restarting, unless
+    `rebuild_frontier` is set or the `max_depth` is larger than the one of
+    the checkpoint, which dropped the deeper urls.
+
+    When an `archive_dir` is given, the raw pages are archived there
+    as they are fetched, to be parsed again later.
+
+    The writes to the db are buffered and committed in batches by a
+    background thread, at least every `flush_every` seconds and whenever
+    `sync_every` more pages have been stored.
+
+    The pages are parsed in a pool of `parse_workers` processes, which only
+    send the resulting citations back, so that parsing neither blocks the
+    event loop nor is limited to a single core. With 0 parse workers, the
+    pages are parsed on the event loop.
+
+    A url which fails is retried after a growing delay, and given up after
+    `max_attempts` attempts. It stays in the checkpointed frontier meanwhile.
+    After `breaker_threshold` failures in a row from a host, its urls are
+    put aside for a while, so that the workers keep to the healthy hosts.
+
+    With `recrawl`, that many stored articles are fetched again, the ones
+    most likely to have new cited-by entries first, unless fetched less than
+    `recrawl_min_age` days ago. Only their changed edges are written, and the
+    new articles they link to are queued. A recrawled url which fails keeps
+    its stored citation.
+
+    With a `metrics_port`, the metrics are served on /metrics at that port.
+    With `profiling` as well, the hot stacks are served on /debug/profile,
+    and logged on SIGUSR1.
+    """
+
+    BACKENDS = ('browser', 'eutils')
 
     def __init__(self,
                  filename: str,
                  seeds: Optional[List[str]] = None,
                  max_depth: int = 5,
-                 sync_every: int = 20):
+                 sync_every: int = 20,
+                 workers: int = 1,
+                 min_delay: float = 1.0,
+                 backend: str = 'browser',
+                 max_seen: Optional[int] = None,
+                 rebuild_frontier: bool = False,
+                 archive_dir: Optional[str] = None,
+                 parse_workers: int = 0,
+                 metrics_port: Optional[int] = None,
+                 profiling: bool = False,
+                 flush_every: float = 1.0,
+                 max_attempts: int = 4,
+                 retry_delay: float = 30.0,
+                 breaker_threshold: int = 5,
+                 browser_options: Optional[browser.BrowserOptions] = None,
+                 recrawl: int = 0,
+                 recrawl_min_age: float = 7.0,
+                 eutils_url: str = eutils.EUTILS_URL):
+        if backend not in self.BACKENDS:
+            raise ValueError(f'Unknown backend: {backend}')
+
         self.filename = filename
-        self.db = shelve.open(filename)
-        self.queue = queues.Queue()
+        self.store = store.CitationStore(filename)
+        self.db = self.make_writer(flush_every)
+        self.archive = None
+        if archive_dir is not None:
+            self.archive = archive.PageArchive(archive_dir)
+        self.queue = frontier.Frontier(max_seen, checkpoint=self.db)
         self.seeds = seeds
         self.max_depth = max_depth
-        self.parsers = [pubmed.PubmedFetcher()]
+        self.rebuild_frontier = rebuild_frontier
+        self.backend = backend
+        self._eutils = None
+        self.browser_options = browser_options
+        self.eutils_url = eutils_url
+        self.fetchers = [self.make_fetchers() for _ in range(workers)]
+        self.limiter = ratelimit.HostRateLimiter(min_delay)
+        self.retries = retry.RetryScheduler(
+            base_delay=retry_delay, max_attempts=max_attempts)
+        self.breaker = retry.CircuitBreaker(
+            breaker_threshold, cooldown=2 * retry_delay)
+        self.parse_pool = None
+        if parse_workers > 0:
+            self.parse_pool = concurrent.futures.ProcessPoolExecutor(
+                parse_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=ignore_signals)
         self.count = 0
+        self.in_flight = 0
+        # The stored urls to fetch again.
+        self.recrawling = set()
         self.initialize_queue()
+        if recrawl:
+            self.queue_recrawl(recrawl, recrawl_min_age)
+        # The writer thread writes to the db once the reads are committed.
+        self.store.sync()
         self.sync_every = sync_every
+        self.metrics_port = metrics_port
+        self.profiling = profiling
+        self._metrics_server = None
+        QUEUE_DEPTH.set_function(self.queue.qsize)
+        IN_FLIGHT.set_function(lambda: self.in_flight)
 
         self._stop_request = False
         signals = set([signal.SIGQUIT, signal.SIGINT, signal.SIGTERM])
         for sig in signals:
-            signal.signal(sig, self.stop)
+            signal.signal(sig, self.on_signal)
+        if profiling:
+            signal.signal(signal.SIGUSR1, lambda *args: metrics.log_stacks())
+
+    def serve_metrics(self):
+        handlers = [(r'/metrics', metrics.MetricsHandler)]
+        if self.profiling:
+            handlers.append((r'/debug/profile', metrics.ProfileHandler))
+        self._metrics_server = tornado.web.Application(handlers).listen(
+            self.metrics_port)
+        logging.info(f'Metrics on port {self.metrics_port}')
+
+    def make_writer(self, flush_every: float) -> writer.StoreWriter:
+        return writer.StoreWriter(self.store, flush_every)
+
+    def make_fetchers(self) -> list:
+        if self.backend == 'eutils':
+            if self._eutils is None:
+                self._eutils = eutils.EutilsFetcher(self.eutils_url)
+            return [self._eutils]
+        return [pubmed.PubmedFetcher(self.browser_options)]
 
     async def scrape(self):
-        while not self.queue.empty() and not self._stop_request:
+        # The blocking fetches run in threads: one per worker is enough.
+        loop = tornado.ioloop.IOLoop.current()
+        loop.set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(len(self.fetchers)))
+        if self.metrics_port is not None:
+            self.serve_metrics()
+        self.db.start()
+        requeue = tornado.ioloop.PeriodicCallback(self.requeue, 1000)
+        requeue.start()
+        for fetchers in self.fetchers:
+            loop.spawn_callback(self.work, fetchers)
+        await self.wait_done()
+        requeue.stop()
+        self.stop()
+
+    async def wait_done(self):
+        """Waits for the crawl to be over."""
+        # The queue may be drained while some urls wait for their retry.
+        while True:
+            await self.queue.join()
+            if self._stop_request or not len(self.retries):
+                break
+            await tornado.gen.sleep(
+                max(self.retries.next_due() - time.monotonic(), 0))
+            self.requeue()
+
+    def requeue(self):
+        """Queues back the urls due for a retry."""
+        for depth, url in self.retries.pop_due():
+            self.queue.restore(url, depth, 1)
+
+    async def work(self, fetchers: list):
+        """A worker: processes the urls from the queue until it is drained."""
+        while not self._stop_request:
             depth, url = await self.queue.get()
+            self.in_flight += 1
             try:
-                success = await self.process(depth, url)
+                success = await self.process(depth, url, fetchers)
                 self.count += int(success)
-                if self.count % self.sync_every == 0:
-                    logging.info(f'Syncing shelve ({self.count})')
+                if success and self.count % self.sync_every == 0:
+                    logging.info(f'Syncing db ({self.count})')
                     self.db.sync()
-            except:
-                logging.error(f'Cannot process {url}')
-                self.db[url] = None
+                    if self.archive is not None:
+                        self.archive.sync()
+            except Exception as e:
+                self.failed(depth, url, e)
             finally:
+                self.in_flight -= 1
+                if url not in self.retries:
+                    self.db.frontier_remove(url)
                 self.queue.task_done()
-            
-        self.stop()
+
+    def failed(self, depth: int, url: str, error: Exception):
+        """Schedules a retry of a failed url, or gives up on it."""
+        failure = retry.classify(error)
+        if self.retries.failed(depth, url, failure):
+            logging.warning(f'Cannot process {url} ({failure}), attempt '
+                            f'{self.retries.attempts(url)}: {error}')
+            PAGES.labels('retried').inc()
+            return
+
+        logging.error(f'Cannot process {url} ({failure}), giving up: {error}')
+        PAGES.labels('error').inc()
+        if url in self.recrawling:
+            self.recrawling.discard(url)
+            return
+        self.db[url] = None
+
+    def on_signal(self, *args):
+        # The interrupted code may hold the lock of the writer, which stop
+        # waits for: it runs from the event loop instead.
+        tornado.ioloop.IOLoop.current().add_callback(self.stop)
 
     def stop(self, *args):
+        if self._stop_request:
+            return
+
         logging.info("Saving to db.")     
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
         self.db.close()
-        for parser in self.parsers:
-            parser.stop()
+        self.store.close()
+        if self.archive is not None:
+            self.archive.close()
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=False, cancel_futures=True)
+        for fetchers in self.fetchers:
+            for fetcher in fetchers:
+                fetcher.stop()
 
         self._stop_request = True
         tornado.ioloop.IOLoop.current().stop()
@@ -66,54 +303,136 @@ class BiblioScraper:
         # sys.exit(1)
 
     def add_to_queue(self, depth: int, url: str):
-        if url and url not in self.db:
-            self.queue.put((depth, url))
+        """Queues the canonical url of an article, unless already stored."""
+        url = identity.canonical_url(url)
+        if not url:
+            return
+        if not self.queue.has_seen(url) and url in self.db:
+            # Saves the next lookups of this url in the db.
+            self.queue.mark_seen(url)
+            return
+        self.queue.put_nowait((depth, url))
 
     def add_citation_to_queue(self, cite: citation.Citation):
+        # An article with both a PubMed and a PMC page is queued under a
+        # single one of them, the one already seen if any.
         for ref in cite.references + cite.cited_by:
-            for url in (ref.pm_url, ref.pmc_url):
-                self.add_to_queue(cite.depth, url)
+            urls = identity.urls(ref)
+            if not urls:
+                continue
+            seen = [url for url in urls if self.queue.has_seen(url)]
+            url = seen[0] if seen else urls[0]
+            self.add_to_queue(cite.depth, url)
+            for other in urls:
+                if other != url and not self.queue.has_seen(other):
+                    self.queue.mark_seen(other)
 
     def initialize_queue(self):
         """Initializes the queue with the seeds or the unfound links."""
+        # The checkpoint is marked as written along with its first urls.
         if self.seeds:
+            self.store.clear_frontier()
             for seed in self.seeds:
                 self.add_to_queue(0, seed)
+            self.db.checkpoint_frontier(self.max_depth)
             return
 
-        for url in self.db.keys():
+        max_depth = self.store.frontier_depth
+        deeper = max_depth is not None and max_depth < self.max_depth
+        if self.store.has_frontier and not (self.rebuild_frontier or deeper):
+            for url, depth, score in self.store.frontier():
+                self.queue.restore(url, depth, score)
+                # The stored urls left in the frontier were being recrawled.
+                if url in self.store:
+                    self.recrawling.add(url)
+            # The urls beyond this depth will be dropped from it.
+            self.db.checkpoint_frontier(self.max_depth)
+            logging.info(f'Restored {self.queue.qsize()} urls to scrape.')
+            return
+
+        if self.store.has_frontier and deeper:
+            logging.info(f'Rebuilding the frontier, checkpointed up to depth '
+                         f'{max_depth} only.')
+        self.store.clear_frontier()
+        for cite in self.store.values():
             self.count += 1
-            self.add_citation_to_queue(self.db[url])
-        logging.info(f'Already {self.count} citation on shelve.')
+            if cite is not None:
+                self.add_citation_to_queue(cite)
+        self.db.checkpoint_frontier(self.max_depth)
+        logging.info(f'Already {self.count} citation on db.')
+
+    def queue_recrawl(self, n: int, min_age: float):
+        """Queues the n stored articles most likely to have new citations."""
+        scheduler = recrawl.RecrawlScheduler(min_age=min_age)
+        chosen = scheduler.choose(self.store, n)
+        for url, depth, priority in chosen:
+            self.recrawling.add(url)
+            # The stored depth is one more than the queued one. The url is
+            # checkpointed, to be recrawled after a restart as well.
+            self.queue.restore(url, depth - 1, priority, checkpoint=True)
+        expected = sum(priority * depth for _, depth, priority in chosen)
+        logging.info(f'Fetching {len(chosen)} stored articles again, '
+                     f'expecting {expected:.0f} new cited-by entries.')
 
-    async def process(self, depth, url) -> bool:
+    async def parse(self, parser, html: str) -> citation.Citation:
+        with PARSE_SECONDS.time():
+            if self.parse_pool is None:
+                return parser.parse(html)
+
+            loop = tornado.ioloop.IOLoop.current()
+            return await loop.run_in_executor(
+                self.parse_pool, parse_with, type(parser), html)
+
+    async def process(self, depth, url, fetchers) -> bool:
         """Processes a single element from the queue."""
         if depth > self.max_depth:
+            PAGES.labels('too_deep').inc()
             return False
         
-        if url in self.db:
-            cite = self.db[url]
-            cite.depth = min(cite.depth, depth + 1)
-            self.db[url] = cite
+        if url in self.db and url not in self.recrawling:
+            self.db.update_depth(url, depth + 1)
+            PAGES.labels('known').inc()
             return False
 
-        matches = [p.matches(url) for p in self.parsers]
+        matches = [p.matches(url) for p in fetchers]
         if not any(matches):
             logging.error(f'No parser found for {url}')
+            PAGES.labels('no_parser').inc()
             return False
 
-        parser = self.parsers[matches.index(True)]                
+        reopens_at = self.breaker.reopens_at(url)
+        if reopens_at is not None:
+            # Put aside without counting an attempt, the host being down.
+            self.retries.defer(depth, url, reopens_at)
+            PAGES.labels('deferred').inc()
+            return False
+
+        parser = fetchers[matches.index(True)]
+        if self.backend == 'browser':
+            # The eutils fetcher limits its own batched requests.
+            await self.limiter.wait(url)
         try:
-            html = await parser.fetch(url)
-        except:
+            with FETCH_SECONDS.labels(parser.NAME).time():
+                html = await parser.fetch(url)
+        except Exception:
             logging.error(f'Could not fetch {url}')
-            html = None
+            self.breaker.failed(url)
+            raise
+        self.breaker.succeeded(url)
         if html is None:
+            PAGES.labels('not_fetched').inc()
             return False
+        if self.archive is not None:
+            self.archive.put(url, parser.NAME, html)
 
-        # TODO(oliviert): add a try catch here.
-        cite = parser.parse(html)
+        try:
+            cite = await self.parse(parser, html)
+        except Exception as e:
+            raise retry.ParseError(f'{type(e).__name__}: {e}') from e
         cite.depth = depth + 1
         self.db[url] = cite
+        self.recrawling.discard(url)
+        self.retries.succeeded(url)
         self.add_citation_to_queue(cite)    
+        PAGES.labels('stored').inc()
         return True
\ No newline at end of file
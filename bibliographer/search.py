@@ -0,0 +1,171 @@
+"""A full-text index of the titles and abstracts, ranked with BM25.
+
+The postings are stored in SQLite next to the articles, and are updated in
+the same transaction as the citations they index. A query only reads the
+postings of its terms, and may boost the most cited articles.
+"""
+
+import collections
+import math
+import re
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from bibliographer import citation
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS postings (
+    term INTEGER NOT NULL,
+    article INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, article)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_article ON postings(article);
+
+CREATE TABLE IF NOT EXISTS documents (
+    article INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL
+);
+"""
+
+# The indexed fields, with the weight of their terms.
+FIELDS = {'title': 2, 'abstract': 1, 'title_fr': 2, 'abstract_fr': 1}
+STOPWORDS = frozenset("""
+a an and are as at be by for from has in is it its of on or that the to was
+were with we our this these which not no but than into can been also
+au aux avec ce ces dans de des du elle en et est il ils la le les leur lui
+mais ne nous ou par pas pour qui que se sur un une
+""".split())
+TOKEN_REGEX = re.compile(r'[^\W_]+')
+
+# The BM25 parameters.
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [t for t in TOKEN_REGEX.findall((text or '').casefold())
+            if t not in STOPWORDS and (len(t) > 1 or t.isdigit())]
+
+
+def term_counts(cite: citation.Citation) -> Dict[str, int]:
+    counts = collections.Counter()
+    for field, weight in FIELDS.items():
+        for term in tokenize(getattr(cite, field)):
+            counts[term] += weight
+    return counts
+
+
+class SearchIndex:
+    """An inverted index of the articles, in the connection of a store."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self._conn.executescript(SCHEMA)
+        self._conn.create_function('log1p', 1, math.log1p, deterministic=True)
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def term_ids(self, terms: List[str]) -> Dict[str, int]:
+        """The ids of the terms, added to the vocabulary if needed."""
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO terms (term) VALUES (?)',
+            [(t,) for t in terms])
+        result = {}
+        for i in range(0, len(terms), 500):
+            chunk = terms[i:i + 500]
+            marks = ', '.join('?' * len(chunk))
+            result.update(self._conn.execute(
+                f'SELECT term, id FROM terms WHERE term IN ({marks})', chunk))
+        return result
+
+    def remove(self, article_id: int):
+        self._conn.execute('DELETE FROM postings WHERE article = ?',
+                           (article_id,))
+        self._conn.execute('DELETE FROM documents WHERE article = ?',
+                           (article_id,))
+
+    def add(self, article_id: int, cite: Optional[citation.Citation]):
+        """Indexes a citation, in place of the previous one of the article."""
+        self.remove(article_id)
+        if cite is None:
+            return
+        counts = term_counts(cite)
+        if not counts:
+            return
+
+        ids = self.term_ids(list(counts))
+        self._conn.executemany(
+            'INSERT INTO postings (term, article, tf) VALUES (?, ?, ?)',
+            [(ids[t], article_id, tf) for t, tf in counts.items()])
+        self._conn.execute(
+            'INSERT INTO documents (article, length) VALUES (?, ?)',
+            (article_id, sum(counts.values())))
+
+    def rebuild(self, rows) -> int:
+        """Indexes the (id, title, abstract, title_fr, abstract_fr) rows."""
+        count = 0
+        for article_id, *texts in rows:
+            self.add(article_id,
+                     citation.Citation(**dict(zip(FIELDS, texts))))
+            count += 1
+        return count
+
+    def search(self, query: str, k: int = 10, offset: int = 0,
+               cited_weight: float = 0.0, depth: Optional[int] = None
+               ) -> List[Tuple[int, float]]:
+        """The ids and scores of the articles best matching a query.
+
+        The BM25 score of an article is multiplied by
+        1 + cited_weight * log(1 + number of citations).
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        marks = ', '.join('?' * len(terms))
+        # The document frequencies are counted from the postings, which saves
+        # maintaining them on every write.
+        known = self._conn.execute(
+            'SELECT t.id, COUNT(*) FROM terms t '
+            'JOIN postings p ON p.term = t.id '
+            f'WHERE t.term IN ({marks}) GROUP BY t.id', terms).fetchall()
+        if not known:
+            return []
+
+        num_docs, total = self._conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents'
+        ).fetchone()
+        avg_length = total / max(num_docs, 1)
+        idfs = [(term_id, math.log(1 + (num_docs - df + 0.5) / (df + 0.5)))
+                for term_id, df in known]
+
+        # The placeholders, in their order in the query.
+        params = [v for idf in idfs for v in idf]
+        params += [K1 + 1, K1, 1 - B, B / avg_length, cited_weight]
+        condition = 'a.missing = 0'
+        if depth is not None:
+            condition += ' AND a.depth = ?'
+            params.append(depth)
+        params += [k, offset]
+        values = ', '.join(['(?, ?)'] * len(idfs))
+        rows = self._conn.execute(
+            f'WITH query (term, idf) AS (VALUES {values}), '
+            'bm25 (k1p, k1, b1, b2) AS (SELECT ?, ?, ?, ?), '
+            'matches AS ('
+            '  SELECT p.article, SUM(q.idf * p.tf * bm25.k1p / (p.tf + '
+            '    bm25.k1 * (bm25.b1 + bm25.b2 * d.length))) AS score '
+            '  FROM query q JOIN bm25 '
+            '  JOIN postings p ON p.term = q.term '
+            '  JOIN documents d ON d.article = p.article '
+            '  GROUP BY p.article) '
+            'SELECT m.article, m.score * (1 + ? * log1p(a.cited)) AS score '
+            'FROM matches m JOIN articles a ON a.id = m.article '
+            f'WHERE {condition} '
+            'ORDER BY score DESC, m.article LIMIT ? OFFSET ?', params)
+        return rows.fetchall()
@@ -2,18 +2,36 @@
 
 import logging
 import os
-import shelve
 import signal
 import sys
+from typing import Optional, Union
 
 import tornado.web
 import tornado.ioloop
 import yaml
 
+from bibliographer import aggregator
+from bibliographer import google_api
+from bibliographer import metrics
+from bibliographer import snapshot
+from bibliographer import store
+from bibliographer.server import cache
 from bibliographer.server import handler
 from bibliographer.server import uimodules
 
 
+REQUEST_SECONDS = metrics.histogram(
+    'bibliographer_request_seconds', 'Time to handle a request.',
+    ['handler', 'status'])
+SNAPSHOT_SECONDS = metrics.histogram(
+    'bibliographer_snapshot_seconds', 'Time to build a snapshot.')
+GRAPH_SECONDS = metrics.histogram(
+    'bibliographer_graph_ranking_seconds',
+    'Time to rank on the citation graph, with its build if needed.', ['mode'])
+SNAPSHOT_GENERATION = metrics.gauge(
+    'bibliographer_snapshot_generation', 'Generation of the served snapshot.')
+
+
 def format_authors(handler, *args):
     result = []
     authors = args[0]
@@ -27,20 +45,69 @@ def format_authors(handler, *args):
 
 
 class WebApp(tornado.web.Application):
-    """A web app for the bibliographer."""
+    """A web app for the bibliographer.
+
+    The handlers serve a snapshot of the ranking shared by all the requests.
+    It is rebuilt in the background whenever the generation of the store
+    changes. The missing translations of the ranked articles are then
+    prefetched in the background as well, and show up in the next snapshot.
+
+    Besides the number of citations, the articles can be ranked on the whole
+    citation graph when numpy and scipy are installed. The graph module is
+    only imported then, and the graph is built on demand, once per generation
+    of the store.
 
-    def __init__(self, config: str = 'config'):
-        with open(f'resources/{config}.yaml') as fp:
-            self.config = yaml.load(fp, Loader=yaml.FullLoader)
+    With a `snapshot` compiled by scripts/compile_snapshot.py in the config,
+    the rankings are served from that file, mapped in memory, and reloaded
+    when it is replaced. The db is then optional: it is only needed for the
+    search and the exports.
+
+    The metrics are served on /metrics, and the hot stacks on /debug/profile
+    when `profiling` is set in the config.
+    """
+
+    def __init__(self, config: Union[str, dict] = 'config'):
+        if isinstance(config, dict):
+            self.config = config
+        else:
+            with open(f'resources/{config}.yaml') as fp:
+                self.config = yaml.load(fp, Loader=yaml.FullLoader)
 
         db_path = self.config.get('db', None)
-        if db_path is None:
-            raise ValueError("Please provide a db in the config file.")
-        self.db = shelve.open(db_path, writeback=True)
+        self.snapshot_path = self.config.get('snapshot', None)
+        if db_path is None and self.snapshot_path is None:
+            raise ValueError("Please provide a db or a snapshot in the config.")
+        self.db = store.CitationStore(db_path) if db_path is not None else None
+        self.mapped = None
+        translations = google_api.TranslationCache(
+            self.config.get('translation_cache', ':memory:'))
+        self.translator = google_api.Translator(translations)
+        self.snapshot = None
+        # The graphs are ranked from the db, unless served from the snapshot:
+        # None until first used, False when they cannot be.
+        self._graphs = None
+        if self.db is None or self.snapshot_path is not None:
+            self._graphs = False
+        self.render_cache = cache.RenderCache(
+            self.config.get('render_cache_size', 256))
+        self._refreshing = False
+        self._translating = False
+        self._refresher = None
 
         handlers = [
-            (r"/", handler.MainHandler)
+            (r"/", handler.MainHandler),
+            (r"/api/ranking", handler.RankingHandler),
+            (r"/metrics", metrics.MetricsHandler),
         ]
+        if self.db is not None:
+            handlers += [
+                (r"/api/search", handler.SearchHandler),
+                (r"/export", handler.ExportHandler),
+            ]
+        if self.config.get('profiling', False):
+            handlers.append((r"/debug/profile", metrics.ProfileHandler))
+        SNAPSHOT_GENERATION.set_function(
+            lambda: -1 if self.snapshot is None else self.snapshot.generation)
         settings = dict(
             application_title = u"Bibliographer",
             template_path = os.path.join(os.path.dirname(__file__), "templates"),
@@ -55,8 +122,156 @@ class WebApp(tornado.web.Application):
         for sig in signals:
             signal.signal(sig, self.stop)
 
+    def log_request(self, handler: tornado.web.RequestHandler):
+        super().log_request(handler)
+        REQUEST_SECONDS.labels(
+            type(handler).__name__, handler.get_status()).observe(
+                handler.request.request_time())
+
+    def build_snapshot(self) -> aggregator.Snapshot:
+        # Runs in a thread, which needs its own connection to the store.
+        db = store.CitationStore(self.db.filename)
+        try:
+            agg = aggregator.CitationAggregator(db, self.translator)
+            return agg.snapshot(self.config.get('top_k', 50))
+        finally:
+            db.close()
+
+    def translate_snapshot(self, snapshot: aggregator.Snapshot):
+        db = store.CitationStore(self.db.filename)
+        try:
+            agg = aggregator.CitationAggregator(db, self.translator)
+            citations = [cite for cite, _ in snapshot.articles]
+            if snapshot.origin is not None:
+                citations.append(snapshot.origin)
+            agg.translate(citations)
+        finally:
+            db.close()
+
+    @property
+    def modes(self):
+        """The available ranking modes."""
+        if self.mapped is not None:
+            return self.mapped.modes
+        if self.graphs() is None:
+            return ('cited',)
+        from bibliographer import graph
+        return ('cited',) + graph.MODES
+
+    def graphs(self):
+        """The cache of the citation graphs, None if they cannot be ranked."""
+        if self._graphs is None:
+            try:
+                from bibliographer import graph
+            except ImportError:
+                logging.warning('The graph modes need numpy and scipy.')
+                self._graphs = False
+            else:
+                self._graphs = graph.GraphCache(self.db.filename)
+        return self._graphs or None
+
+    async def ranking(self, mode: str, k: int, offset: int = 0,
+                      depth: Optional[int] = None):
+        """The (citation, count, score) of the best articles of a mode."""
+        if self.mapped is not None:
+            return self.mapped.top(mode, k, offset, depth)
+        if mode == 'cited':
+            agg = aggregator.CitationAggregator(self.db, self.translator)
+            return [(cite, count, count)
+                    for cite, count in agg.most_cited(k, depth, offset)]
+        return await self.graph_ranking(mode, k, offset, depth)
+
+    def rank_graph(self, generation: int, mode: str, k: int, offset: int = 0,
+                   depth: Optional[int] = None):
+        # Runs in a thread, which needs its own connection to the store.
+        top = self.graphs().top(generation, mode, k, offset, depth)
+        db = store.CitationStore(self.db.filename)
+        try:
+            agg = aggregator.CitationAggregator(db, self.translator)
+            return agg.ranked(top)
+        finally:
+            db.close()
+
+    async def graph_ranking(self, mode: str, k: int, offset: int = 0,
+                            depth: Optional[int] = None):
+        """The (citation, count, score) of the best articles of a mode."""
+        if self.snapshot is None:
+            # The graph is ranked at the generation of the snapshot.
+            raise tornado.web.HTTPError(503, 'The ranking is not ready yet.')
+        loop = tornado.ioloop.IOLoop.current()
+        with GRAPH_SECONDS.labels(mode).time():
+            return await loop.run_in_executor(
+                None, self.rank_graph, self.snapshot.generation, mode, k,
+                offset, depth)
+
+    def load_snapshot(self):
+        """Maps the compiled snapshot, again if it was replaced."""
+        if self.mapped is not None and not self.mapped.changed():
+            return
+
+        previous, self.mapped = self.mapped, snapshot.SnapshotFile(
+            self.snapshot_path)
+        self.snapshot = self.mapped.snapshot(self.config.get('top_k', 50))
+        if previous is not None:
+            previous.close()
+        logging.info(f'Mapped the snapshot of {len(self.mapped)} articles at '
+                     f'generation {self.snapshot.generation}.')
+
+    async def refresh(self):
+        """Rebuilds the snapshot if the store has changed since the last one."""
+        if self.snapshot_path is not None:
+            try:
+                self.load_snapshot()
+            except (OSError, ValueError) as e:
+                logging.error(f'Cannot map the snapshot: {e}')
+            return
+        if self._refreshing:
+            return
+        if (self.snapshot is not None and
+                self.snapshot.generation == self.db.generation):
+            return
+
+        self._refreshing = True
+        loop = tornado.ioloop.IOLoop.current()
+        try:
+            with SNAPSHOT_SECONDS.time():
+                self.snapshot = await loop.run_in_executor(
+                    None, self.build_snapshot)
+            logging.info(f'Snapshot at generation {self.snapshot.generation}.')
+            loop.spawn_callback(self.prefetch_translations, self.snapshot)
+        except Exception as e:
+            logging.error(f'Cannot build the snapshot: {e}')
+        finally:
+            self._refreshing = False
+
+    async def prefetch_translations(self, snapshot: aggregator.Snapshot):
+        if self._translating:
+            return
+
+        self._translating = True
+        try:
+            loop = tornado.ioloop.IOLoop.current()
+            await loop.run_in_executor(None, self.translate_snapshot, snapshot)
+        except Exception as e:
+            logging.error(f'Cannot translate the snapshot: {e}')
+        finally:
+            self._translating = False
+
+    def start_refresh(self):
+        """Checks periodically for changes in the store."""
+        period = self.config.get('refresh_every', 10)
+        self._refresher = tornado.ioloop.PeriodicCallback(
+            self.refresh, period * 1000)
+        self._refresher.start()
+
     def stop(self, *args):
-        self.db.close()
+        if self._refresher is not None:
+            self._refresher.stop()
+        if self.db is not None:
+            self.db.close()
+        if self.mapped is not None:
+            self.mapped.close()
+        self.translator.close()
         tornado.ioloop.IOLoop.current().stop()
         logging.info(f"Stopping {self.__class__.__name__} gracefully.")
         sys.exit(1)
@@ -66,7 +281,9 @@ def run(config: str):
     logging.getLogger().setLevel(logging.INFO)
     app = WebApp(config)
     port = app.config['port']
-    app.listen(port)
     loop = tornado.ioloop.IOLoop.current()
+    loop.run_sync(app.refresh)
+    app.start_refresh()
+    app.listen(port)
     logging.info(f"Up and running on port {port}")
     loop.start()
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""A cache of the rendered pages."""
+
+import collections
+from typing import Hashable, Optional
+
+
+class RenderCache:
+    """Keeps the last rendered pages of a generation of the store.
+
+    The pages are dropped as soon as a page of a newer generation is cached,
+    and the least recently used ones above `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.generation = None
+        self._pages = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def get(self, key: Hashable, generation: int) -> Optional[bytes]:
+        if generation != self.generation:
+            return None
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+        return page
+
+    def put(self, key: Hashable, generation: int, page: bytes):
+        if generation != self.generation:
+            self._pages.clear()
+            self.generation = generation
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
@@ -1,23 +1,245 @@
 """Show the found bibliography."""
 
+import datetime
+import email.utils
+import hashlib
+import json
+from typing import List, Optional, Tuple
+
 import tornado.web
+
 from bibliographer import aggregator
+from bibliographer import export
+from bibliographer import store
+
 
+class CachedHandler(tornado.web.RequestHandler):
+    """A handler whose pages only change with the snapshot of the ranking.
 
-class MainHandler(tornado.web.RequestHandler):
+    The ETag and Last-Modified headers derive from the snapshot, so that the
+    clients revalidate their copy for free, and the pages are rendered once
+    per snapshot and request arguments.
+    """
 
     def initialize(self):
         self.config = self.application.config
-        self.db = self.application.db
-        self._aggregator = aggregator.CitationAggregator(self.db)
-        origins = [
-            v for v in self.db.values() if v is not None and v.depth == 1]
-        self.origin = origins[0] if len(origins) == 1 else None
-
-    def get(self):
-        articles = self._aggregator.most_cited(50)
+        self._cache_key = None
+        self._generation = None
+
+    def get_snapshot(self) -> aggregator.Snapshot:
+        # Only reads the shared snapshot, rebuilt when the store changes.
+        snapshot = self.application.snapshot
+        if snapshot is None:
+            raise tornado.web.HTTPError(503, 'The ranking is not ready yet.')
+        return snapshot
+
+    def compute_etag(self) -> Optional[str]:
+        args = sorted(self.request.query_arguments.items())
+        digest = hashlib.sha1(repr(args).encode('utf-8')).hexdigest()[:16]
+        return f'"{self.application.snapshot.generation}-{digest}"'
+
+    def not_modified(self, snapshot: aggregator.Snapshot) -> bool:
+        """Sets the caching headers, tells whether the client is up to date."""
+        self.set_etag_header()
+        self.set_header('Last-Modified', datetime.datetime.fromtimestamp(
+            snapshot.created, datetime.timezone.utc))
+        if self.request.headers.get('If-None-Match') is not None:
+            return self.check_etag_header()
+
+        since = self.request.headers.get('If-Modified-Since')
+        if since is None:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(snapshot.created) <= since
+
+    def get_mode(self) -> str:
+        mode = self.get_argument('mode', 'cited')
+        if mode not in self.application.modes:
+            raise tornado.web.HTTPError(
+                400, f'The ranking modes are: {", ".join(self.application.modes)}')
+        return mode
+
+    def serve_cached(self, snapshot: aggregator.Snapshot) -> bool:
+        """Finishes with a 304 or a cached page, if possible."""
+        if self.not_modified(snapshot):
+            self.set_status(304)
+            self.finish()
+            return True
+
+        self._cache_key = (type(self).__name__, self.request.uri)
+        self._generation = snapshot.generation
+        page = self.application.render_cache.get(
+            self._cache_key, snapshot.generation)
+        if page is None:
+            return False
+        self.finish(page)
+        return True
+
+    def finish(self, chunk=None):
+        # The pages are cached as they are sent, once fully rendered.
+        if (self._cache_key is not None and chunk is not None and
+                self.get_status() == 200):
+            page = chunk if isinstance(chunk, bytes) else (
+                json.dumps(chunk) if isinstance(chunk, dict) else chunk
+            ).encode('utf-8')
+            self.application.render_cache.put(
+                self._cache_key, self._generation, page)
+            chunk = page
+        return super().finish(chunk)
+
+
+class MainHandler(CachedHandler):
+
+    async def get(self):
+        snapshot = self.get_snapshot()
+        mode = self.get_mode()
+        if self.serve_cached(snapshot):
+            return
+
+        articles = snapshot.articles
+        if mode != 'cited':
+            ranking = await self.application.ranking(
+                mode, self.config.get('top_k', 50))
+            articles = [(cite, count) for cite, count, _ in ranking]
         self.render("index.html",
-                    total=len(self._aggregator),
-                    origin=self.origin,
+                    total=snapshot.total,
+                    origin=snapshot.origin,
                     articles=articles,
-                    config=self.config)
\ No newline at end of file
+                    config=self.config)
+
+
+class RankingHandler(CachedHandler):
+    """The ranking as json, page by page.
+
+    The `offset` and `limit` arguments select the page, `depth` restricts
+    the ranking to the articles at a given depth and `mode` selects how the
+    articles are ranked. Only the DEFAULT_FIELDS are sent, unless others are
+    asked for in `fields`, comma separated.
+    """
+
+    DEFAULT_FIELDS = ('pmid', 'pmcid', 'pm_url', 'pmc_url', 'title',
+                      'authors', 'year', 'journal', 'volume', 'depth')
+    FIELDS = DEFAULT_FIELDS + ('abstract', 'affiliations', 'title_fr',
+                               'abstract_fr')
+
+    def get_int(self, name: str, default: Optional[int]) -> Optional[int]:
+        value = self.get_argument(name, None)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400, f'{name} must be an integer.')
+
+    def get_fields(self) -> List[str]:
+        fields = self.get_argument('fields', None)
+        fields = fields.split(',') if fields else self.DEFAULT_FIELDS
+        unknown = set(fields) - set(self.FIELDS)
+        if unknown:
+            raise tornado.web.HTTPError(
+                400, f'Unknown fields: {", ".join(sorted(unknown))}')
+        return fields
+
+    def get_page(self) -> Tuple[int, int]:
+        """The offset and limit of the requested page."""
+        offset = max(self.get_int('offset', 0), 0)
+        max_limit = self.config.get('max_limit', 500)
+        limit = min(max(self.get_int('limit', 50), 0), max_limit)
+        return offset, limit
+
+    def send(self, ranking, fields: List[str], offset: int, **info):
+        """Sends the (citation, count, score) of a page of a ranking."""
+        articles = []
+        for rank, (cite, count, score) in enumerate(ranking, offset + 1):
+            article = {f: getattr(cite, f) for f in fields}
+            article.update(rank=rank, count=count, score=score)
+            articles.append(article)
+        self.finish(dict(info, offset=offset, articles=articles))
+
+    async def get(self):
+        snapshot = self.get_snapshot()
+        mode = self.get_mode()
+        offset, limit = self.get_page()
+        depth = self.get_int('depth', None)
+        fields = self.get_fields()
+        self.set_header('Content-Type', 'application/json; charset=UTF-8')
+        if self.serve_cached(snapshot):
+            return
+
+        # Read from the store or the snapshot, cached until the next snapshot.
+        ranking = await self.application.ranking(mode, limit, offset, depth)
+        self.send(ranking, fields, offset,
+                  generation=snapshot.generation,
+                  mode=mode,
+                  total=snapshot.total,
+                  limit=limit)
+
+
+class SearchHandler(RankingHandler):
+    """The articles matching a full-text query `q`, as json.
+
+    The articles are ranked by the BM25 relevance of their titles and
+    abstracts, multiplied by 1 + cited_weight * log(1 + their citations).
+    The other arguments are the ones of the ranking.
+    """
+
+    async def get(self):
+        snapshot = self.get_snapshot()
+        query = self.get_argument('q')
+        offset, limit = self.get_page()
+        depth = self.get_int('depth', None)
+        fields = self.get_fields()
+        try:
+            cited_weight = float(self.get_argument(
+                'cited_weight', self.config.get('cited_weight', 0.0)))
+        except ValueError:
+            raise tornado.web.HTTPError(400, 'cited_weight must be a number.')
+        self.set_header('Content-Type', 'application/json; charset=UTF-8')
+        if self.serve_cached(snapshot):
+            return
+
+        agg = aggregator.CitationAggregator(
+            self.application.db, self.application.translator)
+        ranking = agg.search(query, limit, offset, cited_weight, depth)
+        self.send(ranking, fields, offset,
+                  generation=snapshot.generation,
+                  query=query,
+                  limit=limit)
+
+
+class ExportHandler(tornado.web.RequestHandler):
+    """Streams the stored citations, as in scripts/export.py.
+
+    The `format`, `depth` and `min_cited` arguments are the ones of the
+    script. The response is sent in chunks as the store is read.
+    """
+
+    async def get(self):
+        fmt = self.get_argument('format', 'jsonl')
+        if fmt not in export.FORMATS:
+            raise tornado.web.HTTPError(
+                400, f'The formats are: {", ".join(export.FORMATS)}')
+        try:
+            depth = self.get_argument('depth', None)
+            depth = int(depth) if depth is not None else None
+            min_cited = int(self.get_argument('min_cited', 0))
+        except ValueError:
+            raise tornado.web.HTTPError(400, 'Wrong depth or min_cited.')
+
+        content_type, extension = export.FORMATS[fmt]
+        self.set_header('Content-Type', f'{content_type}; charset=UTF-8')
+        self.set_header('Content-Disposition',
+                        f'attachment; filename="citations.{extension}"')
+        # A connection of its own, not to mix its reads with the others.
+        db = store.CitationStore(self.application.db.filename)
+        try:
+            for chunk in export.export(
+                    db, fmt, depth, min_cited,
+                    self.application.config.get('export_batch_size', 500)):
+                self.write(chunk)
+                await self.flush()
+        finally:
+            db.close()
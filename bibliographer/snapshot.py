@@ -0,0 +1,310 @@
+"""A read-only snapshot of the rankings, served from a memory-mapped file.
+
+The snapshot is compiled offline from the store by scripts/compile_snapshot.py.
+It holds:
+  - a string table: the UTF-8 strings, each stored once, and their offsets,
+  - the compact records of the rankable articles: the index of each of their
+    fields in the string table, then their number of citations and depth,
+  - the rankings: for each mode, and for each depth as well as for all of
+    them, the indices of the ranked records and their scores, best first.
+
+The server maps the file rather than reading it: opening it does not depend
+on the number of articles, only the pages which are served are read, and the
+processes serving the same file share them.
+
+All the integers are little-endian and each section is aligned on 8 bytes.
+"""
+
+import array
+import dataclasses
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bibliographer import aggregator
+from bibliographer import citation
+from bibliographer import store
+
+MAGIC = b'BIBSNAP1'
+VERSION = 1
+# magic, version, number of fields, generation, created, total, origin,
+# then the number of records, strings and rankings, and the section offsets.
+HEADER = struct.Struct('<8sIIqdqqqqq7q')
+RANKING = struct.Struct('<16sqqq')
+# The fields of a record, as indices in the string table.
+RECORD_FIELDS = ('pmid', 'pmcid', 'pm_url', 'pmc_url', 'title', 'authors',
+                 'year', 'journal', 'volume', 'abstract', 'affiliations',
+                 'title_fr', 'abstract_fr')
+LIST_FIELDS = ('authors', 'affiliations')
+SEPARATOR = '\x1f'
+# The longer strings are not looked up for duplicates.
+MAX_SHARED_LENGTH = 128
+ALL_DEPTHS = -1
+
+if sys.byteorder != 'little':
+    raise ImportError('The snapshots are only read on little-endian hosts.')
+
+
+@dataclasses.dataclass
+class Ranking:
+    records: array.array
+    scores: array.array
+
+
+class StringTable:
+    """The strings of a snapshot being compiled, written to a temporary file."""
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._indices = {'': 0}
+        self.offsets = array.array('Q', [0, 0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add(self, text: str) -> int:
+        index = self._indices.get(text)
+        if index is not None:
+            return index
+
+        data = text.encode('utf-8')
+        self._file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        index = len(self.offsets) - 2
+        if len(text) <= MAX_SHARED_LENGTH:
+            self._indices[text] = index
+        return index
+
+    def copy_to(self, fp):
+        self._file.seek(0)
+        while True:
+            chunk = self._file.read(1 << 20)
+            if not chunk:
+                return
+            fp.write(chunk)
+
+    def close(self):
+        self._file.close()
+
+
+def field_text(cite: citation.Citation, field: str) -> str:
+    value = getattr(cite, field)
+    if field in LIST_FIELDS:
+        return SEPARATOR.join(value or ())
+    return '' if value is None else str(value)
+
+
+def rankings(ids: array.array, cited: array.array, depths: array.array,
+             db: Optional[store.CitationStore] = None
+             ) -> Iterator[Tuple[str, int, Ranking]]:
+    """The rankings of the records, by mode and depth.
+
+    The graph modes are only ranked when given the store and when numpy and
+    scipy are installed.
+    """
+    modes = {'cited': [float(c) for c in cited]}
+    if db is not None:
+        try:
+            from bibliographer import graph
+        except ImportError:
+            graph = None
+        if graph is not None:
+            citation_graph = graph.CitationGraph.from_store(db)
+            for mode in graph.MODES:
+                scores = citation_graph.scores(mode)
+                modes[mode] = scores[ids].tolist()
+
+    levels = sorted(set(depths))
+    for mode, scores in modes.items():
+        candidates = [i for i, score in enumerate(scores) if score > 0]
+        if mode != 'cited' and mode != 'pagerank':
+            # An article is trivially related to itself.
+            candidates = [i for i in candidates if depths[i] != 1]
+        candidates.sort(key=lambda i: (-scores[i], ids[i]))
+        # Even empty, so that the mode is known as it is from the store.
+        for depth in [ALL_DEPTHS] + levels:
+            records = array.array('I', (
+                i for i in candidates
+                if depth == ALL_DEPTHS or depths[i] == depth))
+            yield mode, depth, Ranking(
+                records, array.array('d', (scores[i] for i in records)))
+
+
+def align(fp) -> int:
+    position = fp.tell()
+    padding = -position % 8
+    fp.write(b'\0' * padding)
+    return position + padding
+
+
+def compile_snapshot(db: store.CitationStore, filename: str,
+                     graph_modes: bool = True) -> int:
+    """Writes the snapshot of a store, returns its number of records.
+
+    The file is written next to its destination then moved in place, so that
+    the servers never map a partial snapshot.
+    """
+    generation = db.generation
+    strings = StringTable()
+    fields = array.array('I')
+    ids, cited, depths = array.array('q'), array.array('i'), array.array('i')
+    for article_id, url, cite, count in db.rankable():
+        if not cite.pm_url:
+            cite.pm_url = url
+        fields.extend(strings.add(field_text(cite, f)) for f in RECORD_FIELDS)
+        ids.append(article_id)
+        cited.append(count)
+        depths.append(cite.depth)
+    origins = [i for i, depth in enumerate(depths) if depth == 1]
+    origin = origins[0] if len(origins) == 1 else -1
+
+    ranked = list(rankings(ids, cited, depths, db if graph_modes else None))
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(b'\0' * HEADER.size)
+            offsets_pos = align(fp)
+            strings.offsets.tofile(fp)
+            data_pos = align(fp)
+            strings.copy_to(fp)
+            records_pos = align(fp)
+            fields.tofile(fp)
+            counts_pos = align(fp)
+            cited.tofile(fp)
+            depths.tofile(fp)
+
+            table_pos = align(fp)
+            start = 0
+            for mode, depth, ranking in ranked:
+                fp.write(RANKING.pack(mode.encode('ascii'), depth, start,
+                                      len(ranking.records)))
+                start += len(ranking.records)
+            index_pos = align(fp)
+            for _, _, ranking in ranked:
+                ranking.records.tofile(fp)
+            scores_pos = align(fp)
+            for _, _, ranking in ranked:
+                ranking.scores.tofile(fp)
+
+            fp.seek(0)
+            fp.write(HEADER.pack(
+                MAGIC, VERSION, len(RECORD_FIELDS), generation, time.time(),
+                len(ids), origin, len(ids), len(strings), len(ranked),
+                offsets_pos, data_pos, records_pos, counts_pos, table_pos,
+                index_pos, scores_pos))
+        # Readable by the servers, as a file created with open would be.
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    finally:
+        strings.close()
+    return len(ids)
+
+
+class SnapshotFile:
+    """A compiled snapshot, mapped in memory."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as fp:
+            self.stat = os.fstat(fp.fileno())
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, num_fields, self.generation, self.created,
+         self.total, self.origin_index, num_records, num_strings,
+         num_rankings, offsets_pos, data_pos, records_pos, counts_pos,
+         table_pos, index_pos, scores_pos) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f'{filename} is not a snapshot of version '
+                             f'{VERSION}.')
+
+        view = memoryview(self._mmap)
+        self._offsets = view[offsets_pos:][:8 * (num_strings + 1)].cast('Q')
+        self._data = view[data_pos:records_pos]
+        size = 4 * num_fields * num_records
+        self._fields = view[records_pos:][:size].cast('I')
+        self._cited = view[counts_pos:][:4 * num_records].cast('i')
+        self._depths = view[counts_pos + 4 * num_records:][
+            :4 * num_records].cast('i')
+        self._num_fields = num_fields
+
+        self.rankings: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        for i in range(num_rankings):
+            mode, depth, start, count = RANKING.unpack_from(
+                self._mmap, table_pos + i * RANKING.size)
+            mode = mode.rstrip(b'\0').decode('ascii')
+            self.rankings[mode, depth] = (start, count)
+        total = sum(count for _, count in self.rankings.values())
+        self._index = view[index_pos:][:4 * total].cast('I')
+        self._scores = view[scores_pos:][:8 * total].cast('d')
+        self._views = [view, self._offsets, self._data, self._fields,
+                       self._cited, self._depths, self._index, self._scores]
+
+    def __len__(self):
+        return len(self._cited)
+
+    @property
+    def modes(self) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys(mode for mode, _ in self.rankings))
+
+    def string(self, index: int) -> str:
+        return str(self._data[self._offsets[index]:self._offsets[index + 1]],
+                   'utf-8')
+
+    def article(self, index: int) -> citation.Citation:
+        start = index * self._num_fields
+        values = {}
+        for i, field in enumerate(RECORD_FIELDS):
+            text = self.string(self._fields[start + i])
+            if field in LIST_FIELDS:
+                if text:
+                    values[field] = text.split(SEPARATOR)
+            else:
+                values[field] = text
+        return citation.Citation(depth=self._depths[index], **values)
+
+    def top(self, mode: str, k: int = 10, offset: int = 0,
+            depth: Optional[int] = None
+            ) -> List[Tuple[citation.Citation, int, float]]:
+        """The citations, counts and scores of a page of a ranking."""
+        if mode not in self.modes:
+            raise ValueError(f'Unknown ranking mode: {mode}')
+        key = (mode, ALL_DEPTHS if depth is None else depth)
+        start, count = self.rankings.get(key, (0, 0))
+        end = start + min(offset + k, count)
+        return [(self.article(self._index[i]), self._cited[self._index[i]],
+                 self._scores[i])
+                for i in range(start + min(offset, count), end)]
+
+    def snapshot(self, k: int = 50) -> aggregator.Snapshot:
+        """What the server shows, as built from the store."""
+        origin = None
+        if self.origin_index >= 0:
+            origin = self.article(self.origin_index)
+        return aggregator.Snapshot(
+            generation=self.generation,
+            created=self.created,
+            total=self.total,
+            origin=origin,
+            articles=[(cite, count) for cite, count, _ in self.top('cited', k)])
+
+    def changed(self) -> bool:
+        """Whether the file was replaced by a newer snapshot."""
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) != (
+            self.stat.st_ino, self.stat.st_mtime_ns)
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.close()
@@ -0,0 +1,740 @@
+"""A SQLite storage for the citations.
+
+The articles and the citation edges are stored in normalized tables: each
+article is a row and each reference or cited-by entry is an edge between two
+article rows. The entries stored by the scraper are keyed by their url, while
+the articles only known as a reference have no url, until they are scraped.
+
+The number of references pointing to each article is maintained along with
+the edges, so that the most cited articles are read from an index.
+
+Every key of an article, from its ids and its urls, is an alias of its row:
+an article reached under several urls is stored once. Two rows found to share
+a key, such as a reference only known by its PMID and another only known by
+its PMCID, are merged into one.
+
+The titles and abstracts of the stored articles are indexed for full-text
+search as they are written.
+
+The times at which the scraper fetched each article are kept, along with the
+number of cited-by entries that the later fetches found, to tell how fast its
+citations grow.
+"""
+
+import collections
+import json
+import logging
+import sqlite3
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from bibliographer import citation
+from bibliographer import identity
+from bibliographer import metrics
+from bibliographer import search
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY,
+    url TEXT UNIQUE,
+    missing INTEGER NOT NULL DEFAULT 0,
+    pmid TEXT NOT NULL DEFAULT '',
+    pmcid TEXT NOT NULL DEFAULT '',
+    pm_url TEXT NOT NULL DEFAULT '',
+    pmc_url TEXT NOT NULL DEFAULT '',
+    title TEXT NOT NULL DEFAULT '',
+    abstract TEXT NOT NULL DEFAULT '',
+    authors TEXT NOT NULL DEFAULT '""',
+    year TEXT NOT NULL DEFAULT '',
+    journal TEXT NOT NULL DEFAULT '',
+    volume TEXT NOT NULL DEFAULT '',
+    depth INTEGER NOT NULL DEFAULT -1,
+    affiliations TEXT NOT NULL DEFAULT '""',
+    title_fr TEXT NOT NULL DEFAULT '',
+    abstract_fr TEXT NOT NULL DEFAULT '',
+    cited INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS articles_pmid ON articles(pmid);
+CREATE INDEX IF NOT EXISTS articles_pmcid ON articles(pmcid);
+CREATE INDEX IF NOT EXISTS articles_cited ON articles(cited);
+CREATE INDEX IF NOT EXISTS articles_depth_cited ON articles(depth, cited);
+
+CREATE TABLE IF NOT EXISTS edges (
+    src INTEGER NOT NULL,
+    kind INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    dst INTEGER NOT NULL,
+    PRIMARY KEY (src, kind, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edges_dst ON edges(dst);
+
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT PRIMARY KEY,
+    article INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS aliases_article ON aliases(article);
+
+CREATE TABLE IF NOT EXISTS frontier (
+    url TEXT PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    score INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS fetches (
+    article INTEGER PRIMARY KEY,
+    first_fetched REAL NOT NULL,
+    fetched_at REAL NOT NULL,
+    fetches INTEGER NOT NULL DEFAULT 1,
+    new_cited_by INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+"""
+
+PUT_SECONDS = metrics.histogram(
+    'bibliographer_store_put_seconds', 'Time to write a citation and its edges.')
+SYNC_SECONDS = metrics.histogram(
+    'bibliographer_store_sync_seconds', 'Time to commit the pending writes.')
+REFETCHED = metrics.counter(
+    'bibliographer_store_refetched',
+    'Articles fetched again, by whether they had new cited-by entries.',
+    ['outcome'])
+NEW_CITED_BY = metrics.counter(
+    'bibliographer_store_new_cited_by',
+    'Cited-by entries found by fetching articles again.')
+
+# The kinds of edges.
+REFERENCE = 0
+CITED_BY = 1
+
+# The columns of an article, in the order of the Citation fields.
+FIELDS = ('pmid', 'pmcid', 'pm_url', 'pmc_url', 'title', 'abstract',
+          'authors', 'year', 'journal', 'volume', 'depth', 'affiliations',
+          'title_fr', 'abstract_fr')
+# The columns read for the references and cited-by entries.
+EDGE_FIELDS = ('pmid', 'pmcid', 'pm_url', 'pmc_url', 'title', 'authors', 'year')
+# The ids of an article are never overwritten with blanks.
+ID_FIELDS = ('pmid', 'pmcid', 'pm_url', 'pmc_url')
+# Neither are its translations, which the pages do not have, unless their
+# source text changed.
+TRANSLATED_FIELDS = {'title_fr': 'title', 'abstract_fr': 'abstract'}
+KEPT_FIELDS = ID_FIELDS + tuple(TRANSLATED_FIELDS)
+# Those are lists, stored as json.
+JSON_FIELDS = ('authors', 'affiliations')
+
+
+def to_row(cite: citation.Citation, fields=FIELDS) -> list:
+    return [json.dumps(getattr(cite, f)) if f in JSON_FIELDS else getattr(cite, f)
+            for f in fields]
+
+
+def from_row(row, fields=FIELDS) -> citation.Citation:
+    values = {f: json.loads(v) if f in JSON_FIELDS else v
+              for f, v in zip(fields, row)}
+    return citation.Citation(**values)
+
+
+class CitationStore:
+    """Stores the citations in a SQLite database.
+
+    It behaves like the shelve it replaces: citations are read and written by
+    url, `None` marking the urls that could not be processed. The writes are
+    grouped in a transaction which is committed on `sync`.
+
+    Each commit increments the generation of the store, which tells its
+    readers when their cached data is outdated.
+
+    The pending urls of the crawl frontier are checkpointed along with the
+    citations, so that a crawl resumes without rebuilding its frontier.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        # The rows merged into another one, during the current write.
+        self._merged = {}
+        # Several scrapers may write to the same store.
+        self._conn = sqlite3.connect(filename, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self.add_cited_column()
+        has_aliases = self.has_table('aliases')
+        has_index = self.has_table('documents')
+        self._conn.executescript(SCHEMA)
+        if not has_aliases:
+            self.add_aliases()
+        self.search = search.SearchIndex(self._conn)
+        if not has_index:
+            with self._conn:
+                count = self.reindex()
+            logging.info(f'Indexed the text of {count} articles.')
+
+    def has_table(self, name: str) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (name,)).fetchone() is not None
+
+    def add_cited_column(self):
+        """Adds and fills the citation counts of a db created without them."""
+        columns = [row[1] for row in self._conn.execute(
+            'PRAGMA table_info(articles)')]
+        if not columns or 'cited' in columns:
+            return
+
+        with self._conn:
+            self._conn.execute(
+                'ALTER TABLE articles ADD COLUMN cited INTEGER NOT NULL DEFAULT 0')
+            self._conn.execute(
+                'UPDATE articles SET cited = (SELECT COUNT(*) FROM edges '
+                f'WHERE edges.dst = articles.id AND edges.kind = {REFERENCE})')
+
+    def add_aliases(self):
+        """Indexes the keys of the articles of a db created without them."""
+        rows = self._conn.execute(
+            'SELECT id, url, pmid, pmcid, pm_url, pmc_url FROM articles '
+            'ORDER BY id').fetchall()
+        self._merged.clear()
+        with self._conn:
+            for article_id, url, *ids in rows:
+                cite = citation.Citation(*ids)
+                self.add_keys(self.merged(article_id),
+                              [identity.url_key(url)] + identity.keys(cite))
+
+    def add_keys(self, article_id: int, keys: List[str]) -> int:
+        """Makes the keys aliases of an article.
+
+        A key already taken by another row means that both rows are the same
+        article, which are merged. Returns the row of the article, which is
+        the other one when it is the one stored under a url.
+        """
+        for key in keys:
+            if not key:
+                continue
+            row = self._conn.execute(
+                'SELECT article FROM aliases WHERE alias = ?', (key,)).fetchone()
+            if row is None:
+                self._conn.execute(
+                    'INSERT INTO aliases (alias, article) VALUES (?, ?)',
+                    (key, article_id))
+            elif row[0] != article_id:
+                article_id = self.merge(article_id, row[0])
+        return article_id
+
+    def merge(self, keep: int, drop: int) -> int:
+        """Merges two rows of a same article, returning the one kept.
+
+        The row stored under a url is kept, and its blank fields are filled
+        from the other one, whose aliases, edges, citation count and fetches
+        it takes over.
+        """
+        columns = ', '.join(FIELDS)
+        rows = {row[0]: row[1:] for row in self._conn.execute(
+            f'SELECT id, url, {columns} FROM articles WHERE id IN (?, ?)',
+            (keep, drop))}
+        if rows[keep][0] is None and rows[drop][0] is not None:
+            keep, drop = drop, keep
+        kept = dict(zip(FIELDS, rows[keep][1:]))
+        dropped = dict(zip(FIELDS, rows[drop][1:]))
+        filled = {f: v for f, v in dropped.items()
+                  if f != 'depth' and kept[f] in ('', '""', '[]')
+                  and v not in ('', '""', '[]')}
+        if dropped['depth'] >= 0 and not 0 <= kept['depth'] <= dropped['depth']:
+            filled['depth'] = dropped['depth']
+        if filled:
+            assignments = ', '.join(f'{f} = ?' for f in filled)
+            self._conn.execute(
+                f'UPDATE articles SET {assignments} WHERE id = ?',
+                list(filled.values()) + [keep])
+
+        self._conn.execute(
+            'UPDATE aliases SET article = ? WHERE article = ?', (keep, drop))
+        has_edges = self._conn.execute(
+            'SELECT 1 FROM edges WHERE src = ? LIMIT 1', (keep,)).fetchone()
+        if has_edges:
+            # Both were stored: the edges of the kept one are the ones shown.
+            self.set_edges(drop, {})
+        else:
+            self._conn.execute(
+                'UPDATE edges SET src = ? WHERE src = ?', (keep, drop))
+        self._conn.execute(
+            'UPDATE edges SET dst = ? WHERE dst = ?', (keep, drop))
+        self._conn.execute(
+            'UPDATE articles SET cited = cited + '
+            '(SELECT cited FROM articles WHERE id = ?) WHERE id = ?',
+            (drop, keep))
+        self._conn.execute(
+            'UPDATE OR IGNORE fetches SET article = ? WHERE article = ?',
+            (keep, drop))
+        self._conn.execute('DELETE FROM fetches WHERE article = ?', (drop,))
+        self.search.remove(drop)
+        self._conn.execute('DELETE FROM articles WHERE id = ?', (drop,))
+        self.reindex('id = ?', (keep,))
+        self._merged[drop] = keep
+        logging.debug(f'Merged the article {drop} into {keep}.')
+        return keep
+
+    def merged(self, article_id: int) -> int:
+        """The row an article was merged into, during the current write."""
+        while article_id in self._merged:
+            article_id = self._merged[article_id]
+        return article_id
+
+    def reindex(self, condition: str = '1', params=()):
+        """Indexes the text of the stored articles matching a condition."""
+        columns = ', '.join(search.FIELDS)
+        return self.search.rebuild(self._conn.execute(
+            f'SELECT id, {columns} FROM articles WHERE url IS NOT NULL '
+            f'AND missing = 0 AND {condition}', params).fetchall())
+
+    def resolve(self, url: str) -> Optional[int]:
+        """The row of the article stored under a url or one of its aliases.
+
+        The aliases of an article are all on its single row, which is the one
+        stored under a url once it is scraped under any of them.
+        """
+        row = self._conn.execute(
+            'SELECT id FROM articles WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            row = self._conn.execute(
+                'SELECT a.id FROM aliases s JOIN articles a ON a.id = s.article '
+                'WHERE s.alias = ? AND a.url IS NOT NULL',
+                (identity.url_key(url),)).fetchone()
+        return row[0] if row is not None else None
+
+    def __len__(self):
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM articles WHERE url IS NOT NULL').fetchone()[0]
+
+    def __contains__(self, url: str) -> bool:
+        return self.resolve(url) is not None
+
+    def __getitem__(self, url: str) -> Optional[citation.Citation]:
+        article_id = self.resolve(url)
+        if article_id is None:
+            raise KeyError(url)
+        columns = ', '.join(FIELDS)
+        row = self._conn.execute(
+            f'SELECT id, missing, {columns} FROM articles WHERE id = ?',
+            (article_id,)).fetchone()
+        return self.load(row)
+
+    def __setitem__(self, url: str, cite: Optional[citation.Citation]):
+        with PUT_SECONDS.time():
+            self.put(url, cite)
+
+    def get(self, url: str, default=None) -> Optional[citation.Citation]:
+        try:
+            return self[url]
+        except KeyError:
+            return default
+
+    def keys(self) -> List[str]:
+        return [row[0] for row in self._conn.execute(
+            'SELECT url FROM articles WHERE url IS NOT NULL')]
+
+    def items(self) -> Iterator[Tuple[str, Optional[citation.Citation]]]:
+        columns = ', '.join(FIELDS)
+        rows = self._conn.execute(
+            f'SELECT url, id, missing, {columns} FROM articles '
+            'WHERE url IS NOT NULL')
+        for row in rows:
+            yield row[0], self.load(row[1:])
+
+    def values(self) -> Iterator[Optional[citation.Citation]]:
+        for _, cite in self.items():
+            yield cite
+
+    def load(self, row, edges: bool = True) -> Optional[citation.Citation]:
+        """Builds a Citation, and its edges, from an (id, missing, ...) row."""
+        article_id, missing = row[:2]
+        if missing:
+            return None
+
+        result = from_row(row[2:])
+        if not edges:
+            return result
+
+        columns = ', '.join(f'a.{f}' for f in EDGE_FIELDS)
+        edges = self._conn.execute(
+            f'SELECT e.kind, {columns} FROM edges e '
+            'JOIN articles a ON a.id = e.dst '
+            'WHERE e.src = ? ORDER BY e.kind, e.position', (article_id,))
+        for edge in edges:
+            cites = result.references if edge[0] == REFERENCE else result.cited_by
+            cites.append(from_row(edge[1:], EDGE_FIELDS))
+        return result
+
+    def at_depth(self, depth: int, limit: int = 10, edges: bool = True
+                 ) -> List[citation.Citation]:
+        """Returns some of the stored articles at the given depth."""
+        columns = ', '.join(FIELDS)
+        rows = self._conn.execute(
+            f'SELECT id, missing, {columns} FROM articles '
+            'WHERE url IS NOT NULL AND missing = 0 AND depth = ? LIMIT ?',
+            (depth, limit))
+        return [self.load(row, edges) for row in rows.fetchall()]
+
+    def owners(self, keys: List[str]) -> dict:
+        """The rows of the keys which are aliases, by key."""
+        marks = ', '.join('?' * len(keys))
+        return dict(self._conn.execute(
+            f'SELECT alias, article FROM aliases WHERE alias IN ({marks})',
+            keys))
+
+    def find_id(self, cite: citation.Citation) -> Optional[int]:
+        """Finds the row of an article from its ids."""
+        keys = identity.keys(cite)
+        owners = self.owners(keys)
+        return next((owners[key] for key in keys if key in owners), None)
+
+    def edge_target(self, cite: citation.Citation) -> int:
+        """Returns the row of a referenced article, adding it if needed."""
+        identity.normalize(cite)
+        keys = identity.keys(cite)
+        owners = self.owners(keys)
+        article_id = next((owners[key] for key in keys if key in owners), None)
+        if article_id is not None:
+            if len(owners) == len(keys) and len(set(owners.values())) == 1:
+                return article_id
+            # The ids it is cited with are new to the article.
+            assignments = ', '.join(
+                f"{f} = COALESCE(NULLIF({f}, ''), ?)" for f in ID_FIELDS)
+            self._conn.execute(
+                f'UPDATE articles SET {assignments} WHERE id = ?',
+                to_row(cite, ID_FIELDS) + [article_id])
+            return self.add_keys(article_id, keys)
+
+        columns = ', '.join(EDGE_FIELDS)
+        values = ', '.join('?' * len(EDGE_FIELDS))
+        article_id = self._conn.execute(
+            f'INSERT INTO articles ({columns}) VALUES ({values})',
+            to_row(cite, EDGE_FIELDS)).lastrowid
+        self.add_keys(article_id, keys)
+        return article_id
+
+    def put(self, url: str, cite: Optional[citation.Citation],
+            fetched_at: Optional[float] = None):
+        """Stores a citation, and its edges, under the given url.
+
+        An article already stored under another url, or only known as a
+        reference of another one, is updated in place and keeps its url.
+        The rows its ids show to be the same article are merged.
+        Only its edges which changed are written.
+
+        The citation is recorded as fetched at `fetched_at`, when given.
+        """
+        self._merged.clear()
+        article_id = self.resolve(url)
+        if cite is None:
+            row = self._conn.execute(
+                'SELECT id FROM articles WHERE url = ?', (url,)).fetchone()
+            if article_id is not None and row is None:
+                # The article was processed under another url.
+                return
+        else:
+            identity.normalize(cite)
+            if article_id is None:
+                article_id = self.find_id(cite)
+
+        values = to_row(cite or citation.Citation())
+        assignments = ', '.join(
+            f"{f} = COALESCE(NULLIF(?, ''), {f})" if f in KEPT_FIELDS
+            else f'{f} = ?' for f in FIELDS)
+        updated = article_id is not None
+        if not updated:
+            columns = ', '.join(FIELDS)
+            marks = ', '.join('?' * len(FIELDS))
+            article_id = self._conn.execute(
+                f'INSERT INTO articles (url, missing, {columns}) '
+                f'VALUES (?, ?, {marks})',
+                [url, cite is None] + values).lastrowid
+        else:
+            if cite is not None:
+                self.clear_translations(article_id, cite)
+            self._conn.execute(
+                f'UPDATE articles SET url = COALESCE(url, ?), missing = ?, '
+                f'{assignments} WHERE id = ?',
+                [url, cite is None] + values + [article_id])
+
+        article_id = self.add_keys(
+            article_id, [identity.url_key(url)] +
+            (identity.keys(cite) if cite is not None else []))
+        if cite is not None and (updated or self._merged):
+            # Along with the translations kept in the row.
+            self.reindex('id = ?', (article_id,))
+        else:
+            self.search.add(article_id, cite)
+        edges = {}
+        if cite is not None:
+            for kind, cites in ((REFERENCE, cite.references),
+                                (CITED_BY, cite.cited_by)):
+                for position, curr in enumerate(cites):
+                    edges[kind, position] = self.edge_target(curr)
+            # Some of those rows may have been merged since.
+            article_id = self.merged(article_id)
+            edges = {key: self.merged(dst) for key, dst in edges.items()}
+        new_cited_by = self.set_edges(article_id, edges)
+        if cite is not None and fetched_at is not None:
+            self.add_fetch(article_id, fetched_at, new_cited_by)
+
+    def clear_translations(self, article_id: int, cite: citation.Citation):
+        """Blanks the translations of an article whose text is changing."""
+        assignments = ', '.join(
+            f"{f} = CASE WHEN {source} = ? THEN {f} ELSE '' END"
+            for f, source in TRANSLATED_FIELDS.items())
+        self._conn.execute(
+            f'UPDATE articles SET {assignments} WHERE id = ?',
+            [getattr(cite, source) for source in TRANSLATED_FIELDS.values()] +
+            [article_id])
+
+    def set_edges(self, article_id: int, edges: dict) -> int:
+        """Replaces the edges of an article, by (kind, position) target.
+
+        Returns the number of its cited-by entries which are new.
+        """
+        rows = self._conn.execute(
+            'SELECT kind, position, dst FROM edges WHERE src = ?', (article_id,))
+        old = {(kind, position): dst for kind, position, dst in rows}
+        self._conn.executemany(
+            'DELETE FROM edges WHERE src = ? AND kind = ? AND position = ?',
+            [(article_id, kind, position)
+             for kind, position in old.keys() - edges.keys()])
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO edges (src, kind, position, dst) '
+            'VALUES (?, ?, ?, ?)',
+            [(article_id, kind, position, dst)
+             for (kind, position), dst in edges.items()
+             if old.get((kind, position)) != dst])
+
+        counts = collections.Counter(
+            dst for (kind, _), dst in edges.items() if kind == REFERENCE)
+        counts.subtract(
+            dst for (kind, _), dst in old.items() if kind == REFERENCE)
+        self.add_counts(counts)
+        cited_by = {dst for (kind, _), dst in old.items() if kind == CITED_BY}
+        return len({dst for (kind, _), dst in edges.items()
+                    if kind == CITED_BY} - cited_by)
+
+    def add_counts(self, counts: collections.Counter):
+        """Updates the citation counts of the referenced articles, by id."""
+        self._conn.executemany(
+            'UPDATE articles SET cited = cited + ? WHERE id = ?',
+            [(count, i) for i, count in counts.items() if count])
+
+    def add_fetch(self, article_id: int, fetched_at: float, new_cited_by: int):
+        """Records a fetch of an article, and the cited-by entries it found."""
+        updated = self._conn.execute(
+            'UPDATE fetches SET fetched_at = ?, fetches = fetches + 1, '
+            '  new_cited_by = new_cited_by + ? WHERE article = ?',
+            (fetched_at, new_cited_by, article_id)).rowcount
+        if not updated:
+            # The first fetch tells nothing of the growth of the article.
+            self._conn.execute(
+                'INSERT INTO fetches (article, first_fetched, fetched_at) '
+                'VALUES (?, ?, ?)', (article_id, fetched_at, fetched_at))
+            return
+        REFETCHED.labels('changed' if new_cited_by else 'unchanged').inc()
+        NEW_CITED_BY.inc(new_cited_by)
+
+    def put_many(self, items: Iterable[Tuple[str, Optional[citation.Citation]]]):
+        """Stores a batch of citations in a single transaction."""
+        try:
+            for url, cite in items:
+                with PUT_SECONDS.time():
+                    self.put(url, cite)
+        except:
+            self.rollback()
+            raise
+        self.sync()
+
+    def num_articles(self) -> int:
+        """The number of stored articles with a PMID."""
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM articles WHERE url IS NOT NULL "
+            "AND missing = 0 AND pmid != ''").fetchone()[0]
+
+    def most_cited(self, k: int = 10, depth: Optional[int] = None,
+                   edges: bool = True, offset: int = 0
+                   ) -> List[Tuple[str, citation.Citation, int]]:
+        """Returns the k stored articles with the biggest number of citations.
+
+        The articles are returned with their url and their count, optionally
+        restricted to the ones at a given depth, and without their references
+        and cited-by entries unless `edges` is set. The first `offset` ones
+        are skipped.
+        """
+        condition = "url IS NOT NULL AND missing = 0 AND pmid != '' AND cited > 0"
+        params = []
+        if depth is not None:
+            condition += ' AND depth = ?'
+            params.append(depth)
+        columns = ', '.join(FIELDS)
+        rows = self._conn.execute(
+            f'SELECT url, cited, id, missing, {columns} FROM articles '
+            f'WHERE {condition} ORDER BY cited DESC LIMIT ? OFFSET ?',
+            params + [k, offset])
+        return [(row[0], self.load(row[2:], edges), row[1])
+                for row in rows.fetchall()]
+
+    def max_id(self) -> int:
+        return self._conn.execute(
+            'SELECT COALESCE(MAX(id), 0) FROM articles').fetchone()[0]
+
+    def graph_edges(self) -> Iterator[Tuple[int, int, int]]:
+        """The (src, kind, dst) of all the edges."""
+        yield from self._conn.execute('SELECT src, kind, dst FROM edges')
+
+    def ranked_ids(self) -> Iterator[Tuple[int, int]]:
+        """The (id, depth) of the stored articles which can be ranked."""
+        yield from self._conn.execute(
+            "SELECT id, depth FROM articles WHERE url IS NOT NULL "
+            "AND missing = 0 AND pmid != ''")
+
+    def rankable(self) -> Iterator[Tuple[int, str, citation.Citation, int]]:
+        """The id, url, citation and count of the ranked_ids, by id."""
+        columns = ', '.join(FIELDS)
+        rows = self._conn.execute(
+            f'SELECT id, url, cited, {columns} FROM articles '
+            "WHERE url IS NOT NULL AND missing = 0 AND pmid != '' ORDER BY id")
+        for row in rows:
+            yield row[0], row[1], from_row(row[3:]), row[2]
+
+    def fetch_history(self) -> Iterator[
+            Tuple[str, int, str, int, Optional[float], Optional[float], int]]:
+        """The fetch history of the stored articles.
+
+        That is their url, depth, year and number of cited-by entries, the
+        times of their first and last fetches, unknown for the articles
+        stored before they were recorded, and the number of cited-by entries
+        found since the first one.
+        """
+        yield from self._conn.execute(
+            'SELECT a.url, a.depth, a.year, (SELECT COUNT(*) FROM edges e '
+            f'  WHERE e.src = a.id AND e.kind = {CITED_BY}), '
+            '  f.first_fetched, f.fetched_at, COALESCE(f.new_cited_by, 0) '
+            'FROM articles a LEFT JOIN fetches f ON f.article = a.id '
+            'WHERE a.url IS NOT NULL AND a.missing = 0')
+
+    def ranked(self, ids: List[int]
+               ) -> List[Tuple[int, str, citation.Citation, int]]:
+        """The id, url, citation and count of some articles, in order."""
+        columns = ', '.join(FIELDS)
+        rows = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            marks = ', '.join('?' * len(chunk))
+            for row in self._conn.execute(
+                    f'SELECT url, cited, id, missing, {columns} FROM articles '
+                    f'WHERE id IN ({marks})', chunk):
+                rows[row[2]] = row
+        return [(i, rows[i][0], self.load(rows[i][2:], edges=False), rows[i][1])
+                for i in ids if i in rows]
+
+    def stream(self, depth: Optional[int] = None, min_cited: int = 0
+               ) -> Iterator[Tuple[str, citation.Citation, int]]:
+        """Iterates over the stored articles, without their edges.
+
+        The rows are read as they are iterated over, optionally restricted to
+        the articles at a given depth or with at least `min_cited` citations.
+        """
+        condition = 'url IS NOT NULL AND missing = 0 AND cited >= ?'
+        params = [min_cited]
+        if depth is not None:
+            condition += ' AND depth = ?'
+            params.append(depth)
+        columns = ', '.join(FIELDS)
+        rows = self._conn.execute(
+            f'SELECT url, cited, {columns} FROM articles WHERE {condition} '
+            'ORDER BY id', params)
+        for row in rows:
+            yield row[0], from_row(row[2:]), row[1]
+
+    def update(self, url: str, **fields):
+        """Updates some scalar fields of a stored citation."""
+        article_id = self.resolve(url)
+        assignments = ', '.join(f'{f} = ?' for f in fields)
+        self._conn.execute(
+            f'UPDATE articles SET {assignments} WHERE id = ?',
+            list(fields.values()) + [article_id])
+        if set(fields) & set(search.FIELDS):
+            self.reindex('id = ?', (article_id,))
+
+    def update_pmid(self, pmid: str, **fields):
+        """Updates some scalar fields of the stored citations with a PMID."""
+        assignments = ', '.join(f'{f} = ?' for f in fields)
+        self._conn.execute(
+            f'UPDATE articles SET {assignments} '
+            'WHERE pmid = ? AND url IS NOT NULL',
+            list(fields.values()) + [pmid])
+        if set(fields) & set(search.FIELDS):
+            self.reindex('pmid = ?', (pmid,))
+
+    def update_depth(self, url: str, depth: int):
+        """Lowers the depth of a stored citation."""
+        self._conn.execute(
+            'UPDATE articles SET depth = MIN(depth, ?) WHERE id = ?',
+            (depth, self.resolve(url)))
+
+    @property
+    def has_frontier(self) -> bool:
+        """Whether the frontier has been checkpointed in this store."""
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'frontier'").fetchone()
+        return row is not None and bool(row[0])
+
+    @property
+    def frontier_depth(self) -> Optional[int]:
+        """The max depth of the crawl which checkpointed the frontier.
+
+        The urls beyond it were dropped from the frontier. It is unknown for
+        the checkpoints made before it was recorded.
+        """
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'frontier_depth'").fetchone()
+        return row[0] if row is not None else None
+
+    def frontier(self) -> Iterator[Tuple[str, int, int]]:
+        """The checkpointed (url, depth, score) of the frontier."""
+        yield from self._conn.execute('SELECT url, depth, score FROM frontier')
+
+    def frontier_put(self, url: str, depth: int, score: int):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO frontier (url, depth, score) VALUES (?, ?, ?)',
+            (url, depth, score))
+
+    def frontier_remove(self, url: str):
+        self._conn.execute('DELETE FROM frontier WHERE url = ?', (url,))
+
+    def clear_frontier(self):
+        """Drops the checkpoint of the frontier, until a new one is written."""
+        self._conn.execute('DELETE FROM frontier')
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('frontier', 0)")
+
+    def checkpoint_frontier(self, max_depth: int):
+        """Marks the frontier as checkpointed, by a crawl up to max_depth."""
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            [('frontier', 1), ('frontier_depth', max_depth)])
+
+    @property
+    def generation(self) -> int:
+        return self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def sync(self):
+        with SYNC_SECONDS.time():
+            if self._conn.in_transaction:
+                self._conn.execute(
+                    "UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            self._conn.commit()
+
+    def rollback(self):
+        """Drops the writes since the last sync."""
+        self._conn.rollback()
+
+    def close(self):
+        self.sync()
+        self._conn.close()
@@ -0,0 +1,206 @@
+"""Writes to the store from a background thread.
+
+The writes are buffered in memory, where the ones to a same url are merged,
+and committed in batches by a thread of their own. The event loop only ever
+waits for a lock around the buffer.
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+from bibliographer import citation
+from bibliographer import metrics
+from bibliographer import store
+
+FLUSH_SECONDS = metrics.histogram(
+    'bibliographer_writer_flush_seconds', 'Time to commit a batch of writes.')
+PENDING = metrics.gauge(
+    'bibliographer_writer_pending', 'Writes waiting to be committed.')
+
+
+class StoreWriter:
+    """A write-behind buffer in front of a CitationStore.
+
+    It takes the writes of the scraper: the citations, the depth updates and
+    the checkpoints of the frontier. They are committed once `flush_every`
+    seconds have passed or `max_pending` citations are waiting, whichever
+    comes first, or when asked to with `sync`. `close` commits what is left.
+
+    The pending citations are visible to `in`, the other reads go to the
+    given store, which must not be written to while the writer runs.
+    """
+
+    def __init__(self,
+                 db: store.CitationStore,
+                 flush_every: float = 1.0,
+                 max_pending: int = 1000):
+        self.db = db
+        self.flush_every = flush_every
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._citations = {}
+        # When the citations were fetched, by url.
+        self._fetched_at = {}
+        self._depths = {}
+        self._frontier = {}
+        # The max depth of the crawl, once its frontier is checkpointed.
+        self._frontier_depth = None
+        # The citations being committed, still visible to the readers.
+        self._writing = {}
+        self._flushing = False
+        self._closed = False
+        self._thread = None
+        PENDING.set_function(self.pending)
+
+    def pending(self) -> int:
+        with self._lock:
+            return (len(self._citations) + len(self._depths) +
+                    len(self._frontier))
+
+    def idle(self) -> bool:
+        """Whether all the writes so far are committed."""
+        with self._lock:
+            return not (self._flushing or self._citations or self._depths or
+                        self._frontier or self._frontier_depth is not None)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name='store-writer', daemon=True)
+        self._thread.start()
+
+    def __contains__(self, url: str) -> bool:
+        with self._lock:
+            if url in self._citations or url in self._writing:
+                return True
+        return url in self.db
+
+    def __setitem__(self, url: str, cite: Optional[citation.Citation]):
+        with self._lock:
+            self._citations[url] = cite
+            # They are written right after their page was fetched and parsed.
+            self._fetched_at[url] = time.time()
+            full = len(self._citations) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def update_depth(self, url: str, depth: int):
+        with self._lock:
+            cite = self._citations.get(url)
+            if cite is not None:
+                cite.depth = min(cite.depth, depth)
+            else:
+                self._depths[url] = min(self._depths.get(url, depth), depth)
+
+    def frontier_put(self, url: str, depth: int, score: int):
+        with self._lock:
+            self._frontier[url] = (depth, score)
+
+    def frontier_remove(self, url: str):
+        with self._lock:
+            self._frontier[url] = None
+
+    def checkpoint_frontier(self, max_depth: int):
+        """Marks the frontier as checkpointed, along with its pending urls."""
+        with self._lock:
+            self._frontier_depth = max_depth
+
+    def sync(self):
+        """Asks for the pending writes to be committed, without waiting."""
+        self._wake.set()
+
+    def run(self):
+        # SQLite connections belong to the thread which opened them.
+        db = store.CitationStore(self.db.filename)
+        try:
+            while True:
+                self._wake.wait(self.flush_every)
+                self._wake.clear()
+                closed = self._closed
+                try:
+                    self.flush(db)
+                except Exception as e:
+                    # The writes which could not be saved are dropped, the
+                    # thread keeps taking the next ones.
+                    logging.error(f'Cannot flush the writes: {e}')
+                    db.rollback()
+                if closed:
+                    return
+        finally:
+            db.close()
+
+    def flush(self, db: store.CitationStore):
+        """Commits the pending writes in a single transaction."""
+        with self._lock:
+            citations, self._citations = self._citations, {}
+            fetched_at, self._fetched_at = self._fetched_at, {}
+            depths, self._depths = self._depths, {}
+            frontier, self._frontier = self._frontier, {}
+            frontier_depth, self._frontier_depth = self._frontier_depth, None
+            self._writing = citations
+            self._flushing = bool(citations or depths or frontier or
+                                  frontier_depth is not None)
+        if not self._flushing:
+            return
+
+        try:
+            with FLUSH_SECONDS.time():
+                self.write(db, citations, depths, frontier, fetched_at,
+                           frontier_depth)
+        except Exception as e:
+            # Saves what can be, one citation at a time.
+            logging.error(f'Cannot commit {len(citations)} citations: {e}')
+            db.rollback()
+            for url, cite in citations.items():
+                try:
+                    self.write(db, {url: cite}, {}, {}, fetched_at)
+                except Exception as e:
+                    logging.error(f'Cannot store {url}: {e}')
+                    db.rollback()
+            try:
+                self.write(db, {}, depths, frontier,
+                           frontier_depth=frontier_depth)
+            except Exception as e:
+                logging.error(f'Cannot commit {len(depths)} depths and '
+                              f'{len(frontier)} frontier updates: {e}')
+                db.rollback()
+        finally:
+            with self._lock:
+                self._writing = {}
+                self._flushing = False
+
+    @staticmethod
+    def write(db: store.CitationStore, citations: dict, depths: dict,
+              frontier: dict, fetched_at: Optional[dict] = None,
+              frontier_depth: Optional[int] = None):
+        fetched_at = fetched_at or {}
+        for url, cite in citations.items():
+            with store.PUT_SECONDS.time():
+                db.put(url, cite, fetched_at.get(url))
+        for url, depth in depths.items():
+            db.update_depth(url, depth)
+        for url, entry in frontier.items():
+            if entry is None:
+                db.frontier_remove(url)
+            else:
+                db.frontier_put(url, *entry)
+        # In the same transaction as the urls it tells are checkpointed.
+        if frontier_depth is not None:
+            db.checkpoint_frontier(frontier_depth)
+        db.sync()
+
+    def close(self):
+        """Commits the pending writes and stops the thread."""
+        self._closed = True
+        if self._thread is not None:
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        else:
+            db = store.CitationStore(self.db.filename)
+            try:
+                self.flush(db)
+            finally:
+                db.close()
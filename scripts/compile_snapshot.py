@@ -0,0 +1,38 @@
+"""Compiles the rankings of a store into a snapshot for the server."""
+
+import argparse
+import logging
+import time
+
+from bibliographer import snapshot
+from bibliographer import store
+
+
+def run():
+    fmt = '%(asctime)s - %(filename)s:%(lineno)s - %(levelname)s - %(message)s'
+    logging.basicConfig(format=fmt, level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--db', type=str, default='biblio.db', help='The path to the db.')
+    parser.add_argument(
+        '--output', type=str, default='biblio.snapshot',
+        help='The path of the snapshot, replaced atomically if it exists.')
+    parser.add_argument(
+        '--no_graph', action='store_true',
+        help='Only rank by number of citations, not on the citation graph.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    db = store.CitationStore(args.db)
+    try:
+        count = snapshot.compile_snapshot(
+            db, args.output, graph_modes=not args.no_graph)
+    finally:
+        db.close()
+    logging.info(f'Compiled {count} articles into {args.output} in '
+                 f'{time.perf_counter() - start:.1f}s.')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,46 @@
+"""Exports the citations of a store as JSONL, CSV, BibTeX or RIS."""
+
+import argparse
+import logging
+import sys
+
+from bibliographer import export
+from bibliographer import store
+
+
+def run():
+    fmt = '%(asctime)s - %(filename)s:%(lineno)s - %(levelname)s - %(message)s'
+    logging.basicConfig(format=fmt, level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--db', type=str, default='biblio.db', help='The path to the db.')
+    parser.add_argument(
+        '--format', type=str, default='jsonl', choices=sorted(export.WRITERS),
+        help='The format of the export.')
+    parser.add_argument(
+        '--output', type=str, default=None,
+        help='The path of the exported file, the standard output by default.')
+    parser.add_argument(
+        '--depth', type=int, default=None,
+        help='Only exports the articles at this distance to the seeds.')
+    parser.add_argument(
+        '--min_cited', type=int, default=0,
+        help='Only exports the articles cited at least this many times.')
+    args = parser.parse_args()
+
+    db = store.CitationStore(args.db)
+    fp = sys.stdout if args.output is None else open(
+        args.output, 'w', encoding='utf-8', newline='')
+    try:
+        for chunk in export.export(db, args.format, args.depth, args.min_cited):
+            fp.write(chunk)
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+        db.close()
+    logging.info(f'Exported {args.db} as {args.format}.')
+
+
+if __name__ == '__main__':
+    run()
@@ -3,6 +3,9 @@ import logging
 import os
 import tornado.ioloop
 
+from bibliographer import browser
+from bibliographer import coordinator
+from bibliographer import eutils
 from bibliographer import scraper
 
 
@@ -17,17 +20,118 @@ def run():
         '--depth', type=int, default=3, help='Distance to the seeds')
     parser.add_argument(
         '--sync_every', type=int, default=20, help='When to sync the db.')
+    parser.add_argument(
+        '--flush_every', type=float, default=1.0,
+        help='Maximum number of seconds between two commits to the db.')
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='Number of pages fetched concurrently.')
+    parser.add_argument(
+        '--min_delay', type=float, default=1.0,
+        help='Minimum delay in seconds between two requests to a same host.')
+    parser.add_argument(
+        '--backend', type=str, default='browser',
+        choices=scraper.BiblioScraper.BACKENDS,
+        help='Fetch pages with a browser or with the NCBI E-utilities.')
+    parser.add_argument(
+        '--eutils_url', type=str, default=eutils.EUTILS_URL,
+        help='The base url of the E-utilities, for instance of a stub server.')
+    parser.add_argument(
+        '--max_seen', type=int, default=0,
+        help='Remember the seen urls in a Bloom filter sized for this many, '
+             'rather than in a set. 0 for a set.')
+    parser.add_argument(
+        '--rebuild_frontier', action='store_true',
+        help='Rebuild the urls to scrape from the db instead of reloading them.')
+    parser.add_argument(
+        '--archive', type=str, default=None,
+        help='A directory where to archive the raw pages.')
+    parser.add_argument(
+        '--parse_workers', type=int, default=2,
+        help='Number of parsing processes, 0 to parse on the event loop.')
+    parser.add_argument(
+        '--metrics_port', type=int, default=None,
+        help='A port where to serve the metrics of the scraper.')
+    parser.add_argument(
+        '--profiling', action='store_true',
+        help='Serve the hot stacks along with the metrics, log them on SIGUSR1.')
+    parser.add_argument(
+        '--max_attempts', type=int, default=4,
+        help='Number of attempts at a url before giving up on it.')
+    parser.add_argument(
+        '--retry_delay', type=float, default=30.0,
+        help='Seconds before the first retry of a url, doubled at each retry.')
+    parser.add_argument(
+        '--breaker_threshold', type=int, default=5,
+        help='Failures in a row after which a host is paused for a while.')
+    parser.add_argument(
+        '--headed', action='store_true',
+        help='Show the browser windows instead of running them headless.')
+    parser.add_argument(
+        '--load_resources', action='store_true',
+        help='Let the browser load the images, fonts and style sheets.')
+    parser.add_argument(
+        '--page_timeout', type=float, default=5.0,
+        help='Seconds to wait for a page to be ready.')
+    parser.add_argument(
+        '--pages_per_browser', type=int, default=200,
+        help='Restart a browser after this many pages, 0 to never.')
+    parser.add_argument(
+        '--max_browser_mb', type=float, default=1500,
+        help='Restart a browser above this resident memory, 0 to never.')
+    parser.add_argument(
+        '--coordinated', action='store_true',
+        help='Share the urls to scrape with the other coordinated scrapers.')
+    parser.add_argument(
+        '--queue', type=str, default=None,
+        help='The SQLite file of the shared queue, the db by default.')
+    parser.add_argument(
+        '--worker_id', type=str, default=None,
+        help='The name of this scraper in the shared queue, host-pid by default.')
+    parser.add_argument(
+        '--lease', type=float, default=300.0,
+        help='Seconds after which the urls of a silent scraper are taken back.')
+    parser.add_argument(
+        '--recrawl', type=int, default=0,
+        help='Fetch again this many stored articles, the ones most likely to '
+             'have new citations first.')
+    parser.add_argument(
+        '--recrawl_min_age', type=float, default=7.0,
+        help='Days before a stored article may be fetched again.')
     parser.add_argument(
         '--seeds', type=str, default='resources/seeds.txt', help='Url seed file.')
     args = parser.parse_args()
+    if args.recrawl and args.coordinated:
+        parser.error('The coordinated scrapers do not recrawl.')
 
     if os.path.exists(args.db):
         seeds = None
     else:
         with open(args.seeds) as fp:
             seeds = [line.strip() for line in fp.readlines()]
-    scp = scraper.BiblioScraper(
-        args.db, seeds=seeds, max_depth=args.depth, sync_every=args.sync_every)
+    kwargs = {}
+    cls = scraper.BiblioScraper
+    if args.coordinated:
+        cls = coordinator.CoordinatedScraper
+        kwargs = dict(
+            queue=coordinator.SQLiteWorkQueue(args.queue or args.db),
+            worker_id=args.worker_id, lease=args.lease)
+    scp = cls(
+        args.db, seeds=seeds, max_depth=args.depth, sync_every=args.sync_every,
+        workers=args.workers, min_delay=args.min_delay, backend=args.backend,
+        max_seen=args.max_seen or None, rebuild_frontier=args.rebuild_frontier,
+        archive_dir=args.archive, parse_workers=args.parse_workers,
+        metrics_port=args.metrics_port, profiling=args.profiling,
+        flush_every=args.flush_every, max_attempts=args.max_attempts,
+        retry_delay=args.retry_delay,
+        breaker_threshold=args.breaker_threshold,
+        browser_options=browser.BrowserOptions(
+            headless=not args.headed, block_resources=not args.load_resources,
+            timeout=args.page_timeout, max_pages=args.pages_per_browser,
+            max_rss_mb=args.max_browser_mb),
+        recrawl=args.recrawl, recrawl_min_age=args.recrawl_min_age,
+        eutils_url=args.eutils_url,
+        **kwargs)
     loop = tornado.ioloop.IOLoop.current()
     loop.add_callback(scp.scrape)
     loop.start()
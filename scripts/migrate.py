@@ -0,0 +1,42 @@
+"""Migrates a shelve db into a SQLite citation store."""
+
+import argparse
+import logging
+import shelve
+
+from bibliographer import store
+
+
+def run():
+    fmt = '%(asctime)s - %(filename)s:%(lineno)s - %(levelname)s - %(message)s'
+    logging.basicConfig(format=fmt, level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--shelve', type=str, required=True, help='The path to the shelve.')
+    parser.add_argument(
+        '--db', type=str, required=True, help='The path to the new db.')
+    parser.add_argument(
+        '--batch_size', type=int, default=1000,
+        help='Number of citations written per transaction.')
+    args = parser.parse_args()
+
+    db = store.CitationStore(args.db)
+    count = 0
+    with shelve.open(args.shelve, flag='r') as old:
+        batch = []
+        for url in old.keys():
+            batch.append((url, old[url]))
+            if len(batch) == args.batch_size:
+                db.put_many(batch)
+                count += len(batch)
+                batch = []
+                logging.info(f'Migrated {count} citations.')
+        db.put_many(batch)
+        count += len(batch)
+    db.close()
+    logging.info(f'Migrated {count} citations to {args.db}.')
+
+
+if __name__ == '__main__':
+    run()
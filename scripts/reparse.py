@@ -0,0 +1,38 @@
+"""Parses the archived pages again into the db."""
+
+import argparse
+import logging
+
+from bibliographer import archive
+from bibliographer import reparse
+from bibliographer import store
+
+
+def run():
+    fmt = '%(asctime)s - %(filename)s:%(lineno)s - %(levelname)s - %(message)s'
+    logging.basicConfig(format=fmt, level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--db', type=str, default='biblio.db', help='The path to the db.')
+    parser.add_argument(
+        '--archive', type=str, required=True,
+        help='The directory of the archived pages.')
+    parser.add_argument(
+        '--processes', type=int, default=None,
+        help='Number of parsing processes, one per core by default.')
+    parser.add_argument(
+        '--batch_size', type=int, default=1000,
+        help='Number of citations written per transaction.')
+    args = parser.parse_args()
+
+    db = store.CitationStore(args.db)
+    pages = archive.PageArchive(args.archive)
+    count = reparse.reparse(db, pages, args.processes, args.batch_size)
+    pages.close()
+    db.close()
+    logging.info(f'Rewrote {count} citations.')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,78 @@
+"""Resumes a crawl from the frontier checkpointed in its store."""
+
+import os
+import signal
+import tempfile
+import unittest
+
+from bibliographer import citation
+from bibliographer import identity
+from bibliographer import scraper
+from bibliographer import store
+
+SIGNALS = (signal.SIGQUIT, signal.SIGINT, signal.SIGTERM)
+
+
+class FrontierTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self._dir.name, 'biblio.db')
+        self._handlers = {sig: signal.getsignal(sig) for sig in SIGNALS}
+
+    def tearDown(self):
+        for sig, handler in self._handlers.items():
+            signal.signal(sig, handler)
+        self._dir.cleanup()
+
+    def make_scraper(self, **kwargs) -> scraper.BiblioScraper:
+        return scraper.BiblioScraper(self.filename, backend='eutils', **kwargs)
+
+    def close(self, scp: scraper.BiblioScraper):
+        scp.db.close()
+        scp.store.close()
+
+    def crawl_seed(self, max_depth: int):
+        """Stores a seed citing 2 articles, as a crawl up to max_depth."""
+        scp = self.make_scraper(seeds=[identity.pubmed_url('1')],
+                                max_depth=max_depth)
+        cite = citation.Citation(pmid='1', depth=1)
+        cite.references = [
+            citation.Citation(pmid=str(i), pm_url=identity.pubmed_url(str(i)))
+            for i in (2, 3)]
+        scp.db[identity.pubmed_url('1')] = cite
+        scp.db.frontier_remove(identity.pubmed_url('1'))
+        if max_depth >= 1:
+            scp.add_citation_to_queue(cite)
+        self.close(scp)
+
+    def test_checkpoint_written_with_its_urls(self):
+        scp = self.make_scraper(seeds=[identity.pubmed_url('1')])
+        db = store.CitationStore(self.filename)
+        self.assertFalse(db.has_frontier)
+        self.close(scp)
+        self.assertTrue(db.has_frontier)
+        self.assertEqual(list(db.frontier()),
+                         [(identity.pubmed_url('1'), 0, 1)])
+        db.close()
+
+    def test_resume(self):
+        self.crawl_seed(max_depth=1)
+        scp = self.make_scraper(max_depth=1)
+        self.assertEqual(scp.queue.qsize(), 2)
+        self.close(scp)
+
+    def test_resume_deeper(self):
+        # The links of the seed were too deep for the first crawl.
+        self.crawl_seed(max_depth=0)
+        scp = self.make_scraper(max_depth=0)
+        self.assertEqual(scp.queue.qsize(), 0)
+        self.close(scp)
+
+        scp = self.make_scraper(max_depth=1)
+        self.assertEqual(scp.queue.qsize(), 2)
+        self.close(scp)
+
+
+if __name__ == '__main__':
+    unittest.main()
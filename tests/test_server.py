@@ -0,0 +1,99 @@
+"""Serves the rankings of a compiled snapshot, without a db."""
+
+import importlib.util
+import json
+import os
+import tempfile
+
+import tornado.testing
+
+from bibliographer import citation
+from bibliographer import snapshot
+from bibliographer import store
+from bibliographer.server import app
+
+URL = 'https://pubmed.ncbi.nlm.nih.gov/{}/'
+
+
+def make_store(filename: str, refs: dict) -> store.CitationStore:
+    """The articles of the pmids, citing the pmids of their references."""
+    db = store.CitationStore(filename)
+    for pmid, cited in refs.items():
+        cite = citation.Citation(
+            pmid=str(pmid), title=f'Article {pmid}', authors=['A. Author'],
+            year='2020', depth=1 if pmid == 1 else 2)
+        cite.references = [citation.Citation(pmid=str(i), pm_url=URL.format(i))
+                           for i in cited]
+        db[URL.format(pmid)] = cite
+    db.sync()
+    return db
+
+
+class ServerTestCase(tornado.testing.AsyncHTTPTestCase):
+    """Serves the snapshot of a store whose pmids cite the REFS."""
+
+    REFS = {}
+
+    def get_app(self):
+        self._dir = tempfile.TemporaryDirectory()
+        db = make_store(os.path.join(self._dir.name, 'biblio.db'), self.REFS)
+        self.snapshot_path = os.path.join(self._dir.name, 'biblio.snapshot')
+        snapshot.compile_snapshot(db, self.snapshot_path)
+        db.close()
+        # No db in the config, not even a null one.
+        self.web_app = app.WebApp({'snapshot': self.snapshot_path})
+        self.web_app.load_snapshot()
+        return self.web_app
+
+    def tearDown(self):
+        self.web_app.mapped.close()
+        self.web_app.translator.close()
+        super().tearDown()
+        self._dir.cleanup()
+
+
+class SnapshotServerTest(ServerTestCase):
+
+    # A seed citing 3 articles, which cite each other.
+    REFS = {1: [2, 3, 4], 2: [3, 4], 3: [4], 4: []}
+
+    def test_main_page(self):
+        response = self.fetch('/')
+        self.assertEqual(response.code, 200)
+        body = response.body.decode('utf-8')
+        self.assertIn(self.snapshot_path, body)
+        self.assertIn('Article 4', body)
+
+    def test_main_page_by_mode(self):
+        for mode in self.web_app.modes:
+            response = self.fetch(f'/?mode={mode}')
+            self.assertEqual(response.code, 200, mode)
+
+    def test_ranking(self):
+        response = self.fetch('/api/ranking?limit=2')
+        self.assertEqual(response.code, 200)
+        ranking = json.loads(response.body)
+        self.assertEqual(ranking['total'], 4)
+        self.assertEqual([a['pmid'] for a in ranking['articles']], ['4', '3'])
+
+    def test_no_search_without_db(self):
+        self.assertEqual(self.fetch('/api/search?q=article').code, 404)
+
+
+class EmptyRankingTest(ServerTestCase):
+
+    # Nothing is cited: every ranking but the pagerank is empty.
+    REFS = {1: [], 2: []}
+
+    def test_every_mode_is_known(self):
+        modes = self.web_app.modes
+        if importlib.util.find_spec('scipy') is not None:
+            self.assertEqual(
+                modes, ('cited', 'pagerank', 'cocitation', 'coupling'))
+        for mode in modes:
+            for depth in ('', '&depth=1', '&depth=2', '&depth=5'):
+                response = self.fetch(f'/api/ranking?mode={mode}{depth}')
+                self.assertEqual(response.code, 200, (mode, depth))
+                if mode != 'pagerank':
+                    self.assertEqual(
+                        json.loads(response.body)['articles'], [])
@@ -0,0 +1,78 @@
+"""Stores each article once, whatever ids it is cited with."""
+
+import os
+import tempfile
+import unittest
+
+from bibliographer import citation
+from bibliographer import identity
+from bibliographer import store
+
+
+def article(pmid: int, *references: citation.Citation) -> citation.Citation:
+    cite = citation.Citation(pmid=str(pmid), title=f'Article {pmid}', depth=1)
+    cite.references = list(references)
+    return cite
+
+
+class AliasesTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.db = store.CitationStore(os.path.join(self._dir.name, 'biblio.db'))
+
+    def tearDown(self):
+        self.db.close()
+        self._dir.cleanup()
+
+    def put(self, cite: citation.Citation):
+        self.db[identity.pubmed_url(cite.pmid)] = cite
+
+    def references(self):
+        """The rows of the articles which were not stored."""
+        return self.db._conn.execute(
+            'SELECT id, pmid, pmcid, cited FROM articles '
+            'WHERE url IS NULL').fetchall()
+
+    def test_new_ids_of_a_reference(self):
+        self.put(article(1, citation.Citation(pmid='7')))
+        self.put(article(2, citation.Citation(pmid='7', pmcid='PMC77')))
+        self.put(article(3, citation.Citation(pmcid='PMC77')))
+
+        [(article_id, pmid, pmcid, cited)] = self.references()
+        self.assertEqual((pmid, pmcid, cited), ('7', 'PMC77', 3))
+        self.assertEqual({dst for _, _, dst in self.db.graph_edges()},
+                         {article_id})
+
+        # Its PMC page is known once it is stored, though it does not tell.
+        self.put(article(7))
+        self.assertIn(identity.pmc_url('PMC77'), self.db)
+        self.assertEqual(self.db.most_cited(1)[0][2], 3)
+
+    def test_merge_rows_of_a_same_reference(self):
+        self.put(article(1, citation.Citation(pmid='8')))
+        self.put(article(2, citation.Citation(pmcid='PMC88')))
+        self.assertEqual(len(self.references()), 2)
+
+        self.put(article(3, citation.Citation(pmid='8', pmcid='PMC88')))
+        [(article_id, pmid, pmcid, cited)] = self.references()
+        self.assertEqual((pmid, pmcid, cited), ('8', 'PMC88', 3))
+        self.assertEqual({dst for _, _, dst in self.db.graph_edges()},
+                         {article_id})
+
+    def test_merge_into_stored_article(self):
+        self.put(article(1, citation.Citation(pmcid='PMC99')))
+        cite = article(9, citation.Citation(pmid='1'))
+        cite.pmcid = 'PMC99'
+        self.put(cite)
+
+        self.assertEqual(self.references(), [])
+        self.assertEqual(self.db[identity.pmc_url('PMC99')].title, 'Article 9')
+        self.assertEqual({(url, count) for url, _, count
+                          in self.db.most_cited(10)},
+                         {(identity.pubmed_url('9'), 1),
+                          (identity.pubmed_url('1'), 1)})
+
+
+if __name__ == '__main__':
+    unittest.main()